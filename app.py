@@ -1,59 +1,60 @@
-from flask import Flask, render_template
-from datetime import datetime
+from flask import Flask, jsonify, render_template, request
+from datetime import date, datetime, time, timedelta
 import math
-import pandas as pd
 
 # Import the new database connection function
 from db import get_db_connection
+from headways import BIN_SECONDS, STOP_ID, WEEKDAYS, load_cube
+from repository import Repository
+from tracing import ServedRecorder
 
 app = Flask(__name__)
+# Looks get_db_connection up on each flush, so a patched connection factory is used too.
+served = ServedRecorder(lambda: get_db_connection())
 
 @app.route('/')
 def index():
     """This function runs when someone visits the main page."""
-    conn = None
+    repo = None
     last_muni_formatted = "N/A"
     muni_count = 0
     avg_interval_minutes = 0
     forecasted_arrival_formatted = "N/A"
 
     try:
-        conn = get_db_connection()
-
-        # --- Get Today's Data (for on-the-fly calculation) ---
-        # PostgreSQL uses CURRENT_DATE for today's date
-        query = "SELECT timestamp FROM detections WHERE DATE(timestamp) = CURRENT_DATE ORDER BY timestamp ASC;"
-        todays_detections_df = pd.read_sql_query(query, conn, parse_dates=['timestamp'])
+        repo = Repository(get_db_connection())
 
-        # --- Calculate Munis Today ---
-        muni_count = len(todays_detections_df)
+        # --- Get Today's Data (aggregated in the database) ---
+        # A plain range on `timestamp` (rather than DATE(timestamp)) lets the
+        # planner prune to the current month's partition, and plain parameters
+        # keep the query portable to the SQLite stand-in. The mean of
+        # consecutive intervals telescopes to (last - first) / (count - 1), so
+        # one summary row is all the page needs.
+        today_start = datetime.combine(date.today(), time.min)
+        muni_count, first_muni_timestamp, last_muni_timestamp = repo.detection_summary(today_start, today_start + timedelta(days=1))
 
         # --- Calculate Average Interval for Today ---
         if muni_count > 1:
-            intervals = todays_detections_df['timestamp'].diff().dt.total_seconds()
-            avg_seconds = intervals.mean()
+            avg_seconds = (last_muni_timestamp - first_muni_timestamp).total_seconds() / (muni_count - 1)
             avg_interval_minutes = int(math.ceil(avg_seconds / 60))
 
         # --- Get Last Bus Seen Time (from today's data if available) ---
-        if not todays_detections_df.empty:
-            last_muni_timestamp = todays_detections_df['timestamp'].iloc[-1]
+        if last_muni_timestamp:
             last_muni_formatted = last_muni_timestamp.strftime('%-I:%M %p')
         else:
             # Fallback to historical data if no buses today
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(last_bus_detected_at) FROM arrival_forecasts")
-            last_muni_fallback = cursor.fetchone()[0]
+            last_muni_fallback = repo.last_forecast_detection()
             if last_muni_fallback:
                 last_muni_formatted = last_muni_fallback.strftime('%-I:%M %p')
-            cursor.close()
 
         # --- Get Latest Forecast (still based on historical analysis) ---
-        cursor = conn.cursor()
-        cursor.execute("SELECT predicted_arrival_at FROM arrival_forecasts ORDER BY forecast_generated_at DESC LIMIT 1")
-        forecast_result = cursor.fetchone()
-        if forecast_result:
-            forecasted_arrival_formatted = forecast_result[0].strftime('%-I:%M %p')
-        cursor.close()
+        predicted_arrival = repo.latest_forecast()
+        if predicted_arrival:
+            forecasted_arrival_formatted = predicted_arrival.strftime('%-I:%M %p')
+
+        # --- Record freshness: today's detections are now visible on the page (written in the background) ---
+        if last_muni_timestamp:
+            served.note(last_muni_timestamp, today_start)
 
     except Exception as e:
         print(f"🚨 DATABASE ERROR: {e}")
@@ -62,8 +63,8 @@ def index():
         avg_interval_minutes = "Error"
         forecasted_arrival_formatted = "Error"
     finally:
-        if conn:
-            conn.close()
+        if repo:
+            repo.close()
 
     return render_template('index.html',
                            last_muni=last_muni_formatted,
@@ -71,6 +72,44 @@ def index():
                            muni_count=muni_count,
                            predicted_arrival_at=forecasted_arrival_formatted)
 
+def get_headway_cells(stop_id):
+    """Reads a stop's precomputed headway cube. Never touches the raw detections."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        return load_cube(conn, stop_id)
+    finally:
+        if conn:
+            conn.close()
+
+@app.route("/data")
+def data():
+    """Heatmap of headways by weekday and hour, served straight from the headway cube."""
+    stop_id = request.args.get("stop", STOP_ID)
+    grid = [[None] * 24 for _ in WEEKDAYS]
+    error = None
+    try:
+        for cell in get_headway_cells(stop_id):
+            # Short typical headways shade green, long ones red.
+            hue = max(0, 120 - int(cell["p50_minutes"] * 4))
+            grid[cell["weekday"]][cell["hour"]] = dict(cell, color=f"hsl({hue}, 70%, 80%)")
+    except Exception as e:
+        print(f"🚨 DATABASE ERROR: {e}")
+        error = "Headway data is unavailable right now."
+
+    return render_template("data.html", stop_id=stop_id, weekdays=WEEKDAYS, grid=grid, error=error)
+
+@app.route("/api/headways")
+def api_headways():
+    """The headway cube as JSON: per (weekday, hour) histogram plus p50/p90 in minutes."""
+    stop_id = request.args.get("stop", STOP_ID)
+    try:
+        cells = get_headway_cells(stop_id)
+    except Exception as e:
+        print(f"🚨 DATABASE ERROR: {e}")
+        return jsonify(error="Headway data is unavailable right now."), 503
+    return jsonify(stop_id=stop_id, bin_seconds=BIN_SECONDS, weekdays=WEEKDAYS, cells=cells)
+
 @app.route("/libraries")
 def libraries():
     return render_template("libraries.html")
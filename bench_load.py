@@ -0,0 +1,352 @@
+"""
+Load test for the Flask dashboard against a local database stand-in.
+
+    # 1. Seed a stand-in with a realistic (scaled-up) detections history
+    python bench_load.py seed --sqlite loadtest.db --rows 2000000
+    DB_HOST=localhost DB_USER=... DB_PASS=... DB_NAME=... python bench_load.py seed --rows 2000000
+
+    # 2. Drive the pages (starts app.py in-process unless --url is given)
+    SQLITE_DB_PATH=loadtest.db python bench_load.py run --concurrency 16 --duration 20
+    python bench_load.py run --url http://127.0.0.1:8080   # e.g. gunicorn pointed at the stand-in
+"""
+import argparse
+import collections
+import datetime
+import io
+import os
+import random
+import sqlite3
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from db import sqlite_timestamp
+from headways import STOP_ID, build_cube, create_headway_tables
+from tracing import create_traces_table
+
+# --- CONSTANTS ---
+TEMPLATE_DB = "muni_detections.db"
+DEFAULT_PATHS = ["/", "/data", "/api/headways", "/about", "/libraries"]
+BATCH_SIZE = 50_000
+
+
+# --- SEEDING ---
+def get_daypart(hour):
+    """Categorizes the hour of the day into a 'daypart'."""
+    if 5 <= hour < 12:
+        return "Morning"
+    elif 12 <= hour < 17:
+        return "Afternoon"
+    elif 17 <= hour < 21:
+        return "Evening"
+    else:
+        return "Night"
+
+
+def hourly_profile(template_db=TEMPLATE_DB):
+    """Mean detections per hour of day, learned from the real edge database when it is available."""
+    try:
+        with sqlite3.connect(template_db) as conn:
+            stamps = [datetime.datetime.fromisoformat(row[0]) for row in conn.execute("SELECT timestamp FROM detections;")]
+    except sqlite3.Error:
+        stamps = []
+    if len(stamps) < 2:
+        return [12.0] * 24
+    days = max((max(stamps) - min(stamps)).total_seconds() / 86400, 1.0)
+    counts = collections.Counter(stamp.hour for stamp in stamps)
+    return [max(counts[hour], 1) / days for hour in range(24)]
+
+
+def generate_history(rows, profile, end=None):
+    """Returns `rows` ascending detection timestamps before `end`, following the hourly profile."""
+    # Walks backwards from `end`, so no detection lands in the future however the random gaps add up.
+    current = end or datetime.datetime.now()
+    history = []
+    for _ in range(rows):
+        rate_per_second = profile[current.hour] / 3600
+        current -= datetime.timedelta(seconds=random.expovariate(rate_per_second))
+        history.append(current)
+    history.reverse()
+    return history
+
+
+def build_rows(rows):
+    """Returns (detections, daily_analysis, arrival_forecasts) rows shaped like main.py writes them."""
+    profile = hourly_profile()
+    detections = list(generate_history(rows, profile))
+
+    groups = collections.defaultdict(list)
+    forecasts = []
+    previous = None
+    for stamp in detections:
+        interval = (stamp - previous).total_seconds() if previous else None
+        groups[(stamp.date(), stamp.strftime('%A'), get_daypart(stamp.hour))].append(interval)
+        # main.py writes one forecast per logged detection.
+        if interval is not None:
+            forecasts.append((stamp, stamp, stamp + datetime.timedelta(seconds=interval), interval))
+        previous = stamp
+
+    now = datetime.datetime.now()
+    analysis = []
+    for (day, weekday, daypart), intervals in groups.items():
+        known = [interval for interval in intervals if interval is not None]
+        analysis.append((day, weekday, daypart, statistics.fmean(known) if known else None, len(intervals), now))
+    return detections, analysis, forecasts
+
+
+def seed_sqlite(path, rows):
+    detections, analysis, forecasts = build_rows(rows)
+    fmt = lambda value: sqlite_timestamp(value) if isinstance(value, datetime.datetime) else value
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            DROP TABLE IF EXISTS detections;
+            DROP TABLE IF EXISTS daily_analysis;
+            DROP TABLE IF EXISTS arrival_forecasts;
+            CREATE TABLE detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TIMESTAMP NOT NULL,
+                bus_count INTEGER NOT NULL
+            );
+            CREATE INDEX detections_timestamp_idx ON detections (timestamp);
+            CREATE TABLE daily_analysis (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis_date DATE NOT NULL,
+                day_of_week TEXT NOT NULL,
+                daypart TEXT NOT NULL,
+                average_interval_seconds REAL,
+                detection_count INTEGER,
+                last_updated TIMESTAMP NOT NULL,
+                UNIQUE(analysis_date, day_of_week, daypart)
+            );
+            CREATE TABLE arrival_forecasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                forecast_generated_at TIMESTAMP NOT NULL,
+                last_bus_detected_at TIMESTAMP NOT NULL,
+                predicted_arrival_at TIMESTAMP NOT NULL,
+                average_interval_used REAL
+            );
+            CREATE INDEX arrival_forecasts_generated_idx ON arrival_forecasts (forecast_generated_at);
+        """)
+        conn.executescript("DROP TABLE IF EXISTS detection_traces; DROP TABLE IF EXISTS headway_cube; DROP TABLE IF EXISTS headway_cube_state;")
+        create_traces_table(conn.cursor())
+        create_headway_tables(conn.cursor())
+        conn.executemany("INSERT INTO headway_cube (stop_id, weekday, hour, headway_count, p50_minutes, p90_minutes, histogram) VALUES (?, ?, ?, ?, ?, ?, ?);",
+                         build_cube(detections))
+        conn.execute("INSERT INTO headway_cube_state (stop_id, last_detection) VALUES (?, ?);", (STOP_ID, fmt(detections[-1])))
+        conn.executemany("INSERT INTO detections (timestamp, bus_count) VALUES (?, 1);", ((fmt(d),) for d in detections))
+        conn.executemany("INSERT INTO daily_analysis (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated) VALUES (?, ?, ?, ?, ?, ?);",
+                         ((row[0].isoformat(), row[1], row[2], row[3], row[4], fmt(row[5])) for row in analysis))
+        conn.executemany("INSERT INTO arrival_forecasts (forecast_generated_at, last_bus_detected_at, predicted_arrival_at, average_interval_used) VALUES (?, ?, ?, ?);",
+                         ((fmt(a), fmt(b), fmt(c), d) for a, b, c, d in forecasts))
+    return len(detections), len(analysis), len(forecasts)
+
+
+def _copy(cursor, table, columns, rows):
+    """Bulk-loads rows with COPY ... FROM STDIN, in batches."""
+    for offset in range(0, len(rows), BATCH_SIZE):
+        buffer = io.StringIO()
+        for row in rows[offset:offset + BATCH_SIZE]:
+            buffer.write("\t".join(r"\N" if value is None else str(value) for value in row) + "\n")
+        buffer.seek(0)
+        cursor.execute(f"COPY {table} ({columns}) FROM STDIN", stream=buffer)
+
+
+def seed_postgres(rows):
+    """Seeds the Postgres server named by DB_HOST (never Cloud SQL) with the partitioned schema."""
+    from db import get_db_connection
+    from partitions import create_partitioned_detections, ensure_partitions, months_between
+
+    if not os.environ.get("DB_HOST"):
+        raise SystemExit("Refusing to seed: set DB_HOST to a local Postgres stand-in (or use --sqlite).")
+
+    detections, analysis, forecasts = build_rows(rows)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS detections, daily_analysis, arrival_forecasts CASCADE;")
+    create_partitioned_detections(cursor)
+    for month in months_between(detections[0], detections[-1]):
+        ensure_partitions(cursor, today=month, months_ahead=0)
+    ensure_partitions(cursor)
+    cursor.execute("""
+        CREATE TABLE daily_analysis (
+            id SERIAL PRIMARY KEY,
+            analysis_date DATE NOT NULL,
+            day_of_week TEXT NOT NULL,
+            daypart TEXT NOT NULL,
+            average_interval_seconds REAL,
+            detection_count INTEGER,
+            last_updated TIMESTAMP NOT NULL,
+            UNIQUE(analysis_date, day_of_week, daypart)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE arrival_forecasts (
+            id SERIAL PRIMARY KEY,
+            forecast_generated_at TIMESTAMP NOT NULL,
+            last_bus_detected_at TIMESTAMP NOT NULL,
+            predicted_arrival_at TIMESTAMP NOT NULL,
+            average_interval_used REAL
+        );
+    """)
+    cursor.execute("CREATE INDEX arrival_forecasts_generated_idx ON arrival_forecasts (forecast_generated_at);")
+    cursor.execute("DROP TABLE IF EXISTS detection_traces, headway_cube, headway_cube_state;")
+    create_traces_table(cursor)
+    create_headway_tables(cursor)
+    _copy(cursor, "headway_cube", "stop_id, weekday, hour, headway_count, p50_minutes, p90_minutes, histogram", build_cube(detections))
+    cursor.execute("INSERT INTO headway_cube_state (stop_id, last_detection) VALUES (%s, %s);", (STOP_ID, detections[-1]))
+    _copy(cursor, "detections", "timestamp, bus_count", [(d, 1) for d in detections])
+    _copy(cursor, "daily_analysis", "analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated", analysis)
+    _copy(cursor, "arrival_forecasts", "forecast_generated_at, last_bus_detected_at, predicted_arrival_at, average_interval_used", forecasts)
+    conn.commit()
+    cursor.execute("ANALYZE;")
+    conn.commit()
+    conn.close()
+    return len(detections), len(analysis), len(forecasts)
+
+
+# --- QUERY COUNTING ---
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+class _CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter.increment()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter.increment()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _CountingConnection:
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self):
+        return _CountingCursor(self._conn.cursor(), self._counter)
+
+    def execute(self, *args, **kwargs):
+        # sqlite3-style shortcut (used by the partition helpers); counted like a cursor's.
+        self._counter.increment()
+        return self._conn.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def start_local_app(counter):
+    """Serves app.py from a background thread with every DB query counted. Returns its base URL."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as webapp
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    connect = webapp.get_db_connection
+    webapp.get_db_connection = lambda: _CountingConnection(connect(), counter)
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+# --- LOAD GENERATION ---
+def drive(url, concurrency, duration):
+    """Hammers `url` from `concurrency` threads for `duration` seconds. Returns (latencies, errors)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+                local_latencies.append(time.perf_counter() - start)
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run(args):
+    counter = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        counter = _QueryCounter()
+        base_url = start_local_app(counter)
+    print(f"--- Load test against {base_url} ({args.concurrency} concurrent clients, {args.duration}s per page) ---")
+    print(f"{'path':<12} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'queries/req':>12}")
+
+    for path in args.paths:
+        urllib.request.urlopen(base_url + path, timeout=30).read()  # warm up connections and templates
+        queries_before = counter.count if counter else 0
+        started = time.perf_counter()
+        latencies, errors = drive(base_url + path, args.concurrency, args.duration)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        queries = f"{(counter.count - queries_before) / max(len(latencies), 1):.1f}" if counter else "n/a"
+        print(f"{path:<12} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.9) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{(latencies[-1] if latencies else float('nan')) * 1000:>8.1f} {errors:>7} {queries:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a local database stand-in and load-test the Flask dashboard.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Fill a stand-in database with synthetic history.")
+    seed_parser.add_argument("--rows", type=int, default=1_000_000, help="Number of detections to generate.")
+    seed_parser.add_argument("--sqlite", metavar="DB_PATH", help="Seed this SQLite file instead of the Postgres at DB_HOST.")
+
+    run_parser = subparsers.add_parser("run", help="Drive the dashboard pages and report throughput and latency.")
+    run_parser.add_argument("--url", help="Base URL of an already running server (default: start app.py in-process).")
+    run_parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Seconds per page.")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        started = time.perf_counter()
+        counts = seed_sqlite(args.sqlite, args.rows) if args.sqlite else seed_postgres(args.rows)
+        print(f"✅ Seeded {counts[0]} detections, {counts[1]} daily analysis rows and {counts[2]} forecasts "
+              f"in {time.perf_counter() - started:.1f}s.")
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
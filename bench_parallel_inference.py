@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+import cv2
+from parallel_inference import ParallelDetector
+
+# --- CONSTANTS ---
+MODEL_WEIGHTS = "yolov8m.pt"
+
+
+def load_clip(path, max_frames):
+    """Decodes up to `max_frames` frames of a clip into memory so decoding isn't measured."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_replay(frames, workers, device, imgsz):
+    """Pushes every frame through a ParallelDetector and returns frames per second."""
+    with ParallelDetector(MODEL_WEIGHTS, frames[0].shape, workers=workers, device=device, imgsz=imgsz) as detector:
+        processed = 0
+        start = time.perf_counter()
+        for frame in frames:
+            slot = detector.free_slot()
+            while slot is None:
+                processed += sum(1 for _ in detector.collect(block=True))
+                slot = detector.free_slot()
+            detector.frame(slot)[...] = frame
+            detector.submit(slot)
+        while detector.in_flight:
+            processed += sum(1 for _ in detector.collect(block=True))
+        elapsed = time.perf_counter() - start
+    return processed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a clip through N inference workers and report throughput scaling.")
+    parser.add_argument("clip", help="Path to a video file to replay.")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1, 2, 4, ... up to the core count).")
+    parser.add_argument("--frames", type=int, default=300, help="Number of frames to replay per run.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--imgsz", type=int, default=640)
+    args = parser.parse_args()
+
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        cores = os.cpu_count() or 1
+        counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+
+    frames = load_clip(args.clip, args.frames)
+    if not frames:
+        print(f"Error: Could not read any frames from '{args.clip}'.")
+        return
+    print(f"Replaying {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from '{args.clip}'")
+
+    baseline = None
+    print(f"\n{'workers':>8} {'fps':>8} {'speedup':>8} {'efficiency':>11}")
+    for workers in counts:
+        fps = run_replay(frames, workers, args.device, args.imgsz)
+        if baseline is None:
+            # Per-worker throughput of the smallest pool is the reference for linear scaling.
+            baseline = fps / workers
+        speedup = fps / baseline
+        print(f"{workers:>8} {fps:>8.2f} {speedup:>7.2f}x {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Per-operation latency of the repository layer on each backend.
+
+    # Seed stand-ins first (see bench_load.py), then time every operation
+    python bench_load.py seed --sqlite loadtest.db --rows 200000
+    python bench_repository.py --sqlite loadtest.db
+    DB_HOST=localhost DB_USER=... DB_PASS=... DB_NAME=... python bench_repository.py --sqlite loadtest.db --postgres
+
+SQLite runs on throwaway copies of the seeded file, once with default settings
+(rollback journal) and once WAL-tuned. --per-call adds the old pattern of one
+connection per operation next to the long-lived repository.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from db import connect_sqlite, get_db_connection
+from repository import Repository
+
+# --- CONSTANTS ---
+WARMUP_ITERATIONS = 10
+
+
+def operations():
+    """(name, fn(repo, i)) pairs; writes commit, as they do in main.py."""
+    today_start = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+    started = datetime.datetime.now()
+
+    def insert_detection(repo, i):
+        repo.insert_detection(started + datetime.timedelta(microseconds=i))
+        repo.commit()
+
+    def upsert_daily_analysis(repo, i):
+        repo.upsert_daily_analysis([(today_start.date(), today_start.strftime('%A'), "Morning", 60.0 + i, i)])
+        repo.commit()
+
+    def insert_forecast(repo, i):
+        now = datetime.datetime.now()
+        repo.insert_forecast(now, now, now + datetime.timedelta(minutes=5), 300.0)
+        repo.commit()
+
+    return [
+        ("insert_detection", insert_detection),
+        ("detection_summary", lambda repo, i: repo.detection_summary(today_start, today_start + datetime.timedelta(days=1))),
+        ("last_detection_time", lambda repo, i: repo.last_detection_time()),
+        ("detection_timestamps (1 day)", lambda repo, i: repo.detection_timestamps(today_start - datetime.timedelta(days=1), today_start)),
+        ("upsert_daily_analysis", upsert_daily_analysis),
+        ("interval_for", lambda repo, i: repo.interval_for(today_start.strftime('%A'), "Morning")),
+        ("insert_forecast", insert_forecast),
+        ("latest_forecast", lambda repo, i: repo.latest_forecast()),
+    ]
+
+
+def time_operation(open_repo, operation, iterations, per_call):
+    """Latencies in seconds. With per_call, each sample includes opening and closing the connection."""
+    latencies = []
+    repo = None if per_call else open_repo()
+    for i in range(WARMUP_ITERATIONS + iterations):
+        started = time.perf_counter()
+        if per_call:
+            with open_repo() as call_repo:
+                operation(call_repo, i)
+        else:
+            operation(repo, i)
+        if i >= WARMUP_ITERATIONS:
+            latencies.append(time.perf_counter() - started)
+    if repo:
+        repo.close()
+    return latencies
+
+
+def sqlite_copy(seeded_path, directory, journal_mode):
+    """A copy of the seeded file with its persistent journal mode set, so every backend starts equal."""
+    path = os.path.join(directory, f"{journal_mode.lower()}.db")
+    shutil.copyfile(seeded_path, path)
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode};")
+    return path
+
+
+def report(label, open_repo, iterations, per_call):
+    print(f"\n--- {label} ---")
+    print(f"{'operation':<30} {'mean µs':>10} {'p50 µs':>10} {'p90 µs':>10} {'p99 µs':>10}")
+    for name, operation in operations():
+        latencies = sorted(time_operation(open_repo, operation, iterations, per_call))
+        pick = lambda fraction: latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1e6
+        print(f"{name:<30} {statistics.fmean(latencies) * 1e6:>10.0f} {pick(0.5):>10.0f} {pick(0.9):>10.0f} {pick(0.99):>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark repository operations on SQLite and Postgres.")
+    parser.add_argument("--sqlite", metavar="DB_PATH", help="A SQLite file seeded with bench_load.py.")
+    parser.add_argument("--postgres", action="store_true", help="Also time the Postgres at DB_HOST (its benchmark rows are deleted afterwards).")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--per-call", action="store_true", help="Also time a fresh connection per operation.")
+    args = parser.parse_args()
+    if not args.sqlite and not args.postgres:
+        parser.error("give --sqlite and/or --postgres")
+
+    backends = []
+    with tempfile.TemporaryDirectory() as directory:
+        if args.sqlite:
+            default_path = sqlite_copy(args.sqlite, directory, "DELETE")
+            tuned_path = sqlite_copy(args.sqlite, directory, "WAL")
+            backends.append(("SQLite, default settings", lambda: Repository(connect_sqlite(default_path, tuned=False))))
+            backends.append(("SQLite, WAL + tuned pragmas", lambda: Repository(connect_sqlite(tuned_path))))
+        if args.postgres:
+            if not os.environ.get("DB_HOST"):
+                raise SystemExit("Refusing to benchmark: set DB_HOST to a local Postgres stand-in.")
+            started = datetime.datetime.now()
+            backends.append(("Postgres at DB_HOST", lambda: Repository(get_db_connection())))
+
+        for label, open_repo in backends:
+            report(f"{label}, long-lived connection", open_repo, args.iterations, per_call=False)
+            if args.per_call:
+                report(f"{label}, connection per operation", open_repo, args.iterations, per_call=True)
+
+    if args.postgres:
+        with Repository(get_db_connection()) as repo:
+            cursor = repo.cursor()
+            cursor.execute("DELETE FROM detections WHERE timestamp >= %s;", (started,))
+            cursor.execute("DELETE FROM arrival_forecasts WHERE forecast_generated_at >= %s;", (started,))
+            repo.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import time
+import numpy as np
+from bench_parallel_inference import load_clip
+from detector import Detector
+from parallel_inference import DEFAULT_CLASSES
+from roi import ROI_TILE_ASPECT, RoiDetector, box_iou, crop_shapes, parse_rois, plan_crops
+
+# --- CONSTANTS ---
+MODEL_WEIGHTS = "yolov8m.pt"
+BUS_CONFIDENCE_THRESHOLD = 0.4  # same threshold main.py logs on
+MATCH_IOU = 0.5
+
+
+def time_detections(detect, frames):
+    """Runs `detect` on every frame. Returns (mean seconds per frame, list of detection arrays)."""
+    outputs = []
+    start = time.perf_counter()
+    for frame in frames:
+        outputs.append(detect(frame))
+    return (time.perf_counter() - start) / len(frames), outputs
+
+
+def inside_any(detections, crops):
+    """Whether each box's centre lies in one of the crops."""
+    centres = (detections[:, :2] + detections[:, 2:4]) / 2
+    return np.array([any(x1 <= cx < x2 and y1 <= cy < y2 for x1, y1, x2, y2 in crops) for cx, cy in centres], dtype=bool)
+
+
+def has_bus(detections, names):
+    """Whether main.py would log a bus for these detections."""
+    return any(names[int(cls)] == 'bus' and conf > BUS_CONFIDENCE_THRESHOLD for conf, cls in detections[:, 4:6])
+
+
+def recall(reference, candidate, names, crops):
+    """
+    Box recall of `candidate` against the full-frame `reference` (same class,
+    IoU >= MATCH_IOU), overall and for boxes centred inside the crops, plus
+    the recall of frames in which a bus would have been logged.
+    """
+    matched = total = matched_in_roi = total_in_roi = bus_frames = bus_frames_found = 0
+    for ref, cand in zip(reference, candidate):
+        ref = ref[ref[:, 4] > BUS_CONFIDENCE_THRESHOLD]
+        if len(ref):
+            found = np.zeros(len(ref), dtype=bool)
+            if len(cand):
+                same_class = ref[:, 5][:, None] == cand[:, 5][None, :]
+                found = ((box_iou(ref, cand) >= MATCH_IOU) & same_class).any(axis=1)
+            in_roi = inside_any(ref, crops)
+            matched += found.sum()
+            total += len(ref)
+            matched_in_roi += found[in_roi].sum()
+            total_in_roi += in_roi.sum()
+
+        if has_bus(ref, names):
+            bus_frames += 1
+            bus_frames_found += has_bus(cand, names)
+    ratio = lambda hits, count: hits / count if count else float("nan")
+    return ratio(matched, total), ratio(matched_in_roi, total_in_roi), ratio(bus_frames_found, bus_frames), bus_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a clip with ROI-cropped inference and compare speed and recall with full frames.")
+    parser.add_argument("clip", help="Path to a video file to replay.")
+    parser.add_argument("--rois", required=True, help='Regions of interest, e.g. "0,0.3,1,0.8" (see DETECTION_ROIS).')
+    parser.add_argument("--imgsz", default="320,416,512", help="Comma-separated ROI inference sizes to compare.")
+    parser.add_argument("--full-imgsz", type=int, default=640, help="Inference size of the full-frame reference.")
+    parser.add_argument("--tile-aspect", type=float, default=ROI_TILE_ASPECT, help="Tile ROIs wider than this aspect ratio (0: never).")
+    parser.add_argument("--frames", type=int, default=300, help="Number of frames to replay.")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    frames = load_clip(args.clip, args.frames)
+    if not frames:
+        print(f"Error: Could not read any frames from '{args.clip}'.")
+        return
+    crops = plan_crops(parse_rois(args.rois), frames[0].shape, args.tile_aspect)
+    model = Detector(MODEL_WEIGHTS, device=args.device, imgsz=args.full_imgsz, ready_file=None).start(frames[0].shape)
+    names = model.names
+
+    full_frame = lambda frame: model.predict(frame, imgsz=args.full_imgsz, classes=list(DEFAULT_CLASSES),
+                                             device=args.device, verbose=False)[0].boxes.data.cpu().numpy()
+    baseline_seconds, reference = time_detections(full_frame, frames)
+
+    print(f"--- ROI inference on {len(frames)} frames of '{args.clip}' ({frames[0].shape[1]}x{frames[0].shape[0]}) ---")
+    print(f"Crops: {crops}")
+    print(f"{'mode':<22} {'ms/frame':>9} {'speedup':>8} {'box recall':>11} {'in-ROI recall':>14} {'bus-frame recall':>17}")
+    print(f"{f'full frame @ {args.full_imgsz}':<22} {baseline_seconds * 1000:>9.1f} {1.0:>7.2f}x {'-':>11} {'-':>14} {'-':>17}")
+    for imgsz in (int(n) for n in args.imgsz.split(",")):
+        # A detector per size, warmed up on the crop batch like main.py's.
+        detector = Detector(MODEL_WEIGHTS, device=args.device, imgsz=imgsz, classes=DEFAULT_CLASSES, ready_file=None)
+        detector.start(crop_shapes(crops))
+        roi_detector = RoiDetector(detector, crops)
+        seconds, candidate = time_detections(roi_detector.detect, frames)
+        box_recall, roi_recall, frame_recall, bus_frames = recall(reference, candidate, names, crops)
+        print(f"{f'ROI @ {imgsz}':<22} {seconds * 1000:>9.1f} {baseline_seconds / seconds:>7.2f}x "
+              f"{box_recall:>11.1%} {roi_recall:>14.1%} {frame_recall:>17.1%}")
+    print(f"Recall is measured against full-frame detections above {BUS_CONFIDENCE_THRESHOLD} confidence "
+          f"({bus_frames} frames with a bus). Boxes outside the ROIs are missed by design; see in-ROI recall.")
+
+
+if __name__ == "__main__":
+    main()
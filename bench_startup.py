@@ -0,0 +1,107 @@
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# --- CONSTANTS ---
+# Runs in a fresh interpreter so every import is a cold import.
+CHILD_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get({path!r})
+responded = time.perf_counter()
+print(f"{{imported - start:.6f}} {{responded - imported:.6f}} {{response.status_code}}")
+"""
+
+
+def measure_in_process(path):
+    """Returns (import seconds, first-response seconds, status) for one cold interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT.format(path=path)],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1]
+    import_seconds, response_seconds, status = output.split()
+    return float(import_seconds), float(response_seconds), int(status)
+
+
+def slowest_imports(limit):
+    """Parses `python -X importtime` output and returns the modules with the largest cumulative time."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        head, cumulative_us, name = line.split("|")
+        self_us = head.split(":")[1]
+        # Each nesting level is indented by two spaces; deeper rows are already
+        # counted in their parents' totals, so only app.py's own imports are kept.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_gunicorn(path, timeout):
+    """Starts `gunicorn app:app` like the container does and times the first successful response."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "app:app"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    return time.perf_counter() - start, response.status
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"gunicorn did not answer {path} within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time and time-to-first-response of app.py.")
+    parser.add_argument("--path", default="/about", help="Request path for the first response (use / to include the database).")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="Also time a real gunicorn boot to first response.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list.")
+    args = parser.parse_args()
+
+    print(f"--- Cold start of app.py ({args.runs} runs, first request {args.path}) ---")
+    samples = [measure_in_process(args.path) for _ in range(args.runs)]
+    imports = [sample[0] for sample in samples]
+    responses = [sample[1] for sample in samples]
+    print(f"Import time:          median {statistics.median(imports) * 1000:8.1f} ms   max {max(imports) * 1000:8.1f} ms")
+    print(f"First response time:  median {statistics.median(responses) * 1000:8.1f} ms   max {max(responses) * 1000:8.1f} ms")
+    print(f"Status codes:         {sorted({sample[2] for sample in samples})}")
+
+    if args.gunicorn:
+        boots = [measure_gunicorn(args.path, timeout=60) for _ in range(args.runs)]
+        print(f"gunicorn boot -> first response: median {statistics.median(b[0] for b in boots) * 1000:8.1f} ms")
+
+    print("\n--- Slowest imports made by app.py (cumulative) ---")
+    for cumulative_us, self_us, name in slowest_imports(args.top):
+        print(f"{cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import random
+import threading
+import time
+import cv2
+
+# --- CONSTANTS ---
+# A webcam index ("0") or device path ("/dev/video0"), a video file path, or an rtsp:// URL.
+CAPTURE_SOURCE = os.environ.get("CAPTURE_SOURCE", "0")
+INITIAL_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+# Consecutive failed reads tolerated before the device is considered failed.
+MAX_CONSECUTIVE_FAILURES = 3
+# A single read blocking longer than this is treated as a stalled stream.
+STALL_SECONDS = 10.0
+
+
+def is_file_source(source):
+    """Whether `source` is a video file. Device paths (/dev/video0) and URLs get reconnects instead."""
+    if not isinstance(source, str) or "://" in source:
+        return False
+    return os.path.isfile(source) or not os.path.abspath(source).startswith("/dev/")
+
+
+class CaptureSource:
+    """
+    A cv2.VideoCapture that heals itself.
+
+    read() blocks until a frame is available: when the device fails or a
+    stream stalls, it is closed and reopened with exponential backoff, sleeping
+    (not spinning) in between. It only returns (False, None) when a file
+    source ends or stop() is called. health() exposes state and counters.
+    """
+
+    def __init__(self, source=CAPTURE_SOURCE, loop_file=False, stall_seconds=STALL_SECONDS,
+                 initial_backoff=INITIAL_BACKOFF_SECONDS, max_backoff=MAX_BACKOFF_SECONDS):
+        self.source = int(source) if str(source).isdigit() else source
+        self.is_file = is_file_source(self.source)
+        self.loop_file = loop_file
+        self.stall_seconds = stall_seconds
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.cap = None
+        self.state = "closed"
+        self.reconnects = 0
+        self.read_failures = 0
+        self.frames_read = 0
+        self.last_frame_time = None
+        self._backoff = initial_backoff
+        self._consecutive_failures = 0
+        self._stop = threading.Event()
+
+    # --- Device handling ---
+    def open(self):
+        """Opens the underlying device. Returns True if it is usable."""
+        if isinstance(self.source, str) and self.source.startswith("rtsp://"):
+            self.cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+            # Bound how long FFmpeg may block so stalls surface as failed reads.
+            timeout_ms = int(self.stall_seconds * 1000)
+            for prop in ("CAP_PROP_OPEN_TIMEOUT_MSEC", "CAP_PROP_READ_TIMEOUT_MSEC"):
+                if hasattr(cv2, prop):
+                    self.cap.set(getattr(cv2, prop), timeout_ms)
+        else:
+            self.cap = cv2.VideoCapture(self.source)
+
+        if self.cap.isOpened():
+            self._set_state("healthy")
+            return True
+        self.cap.release()
+        self.cap = None
+        return False
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self._set_state("closed")
+
+    def stop(self):
+        """Makes a blocked read() return (False, None) promptly, e.g. from another thread."""
+        self._stop.set()
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"📷 Capture source {self.source!r}: {self.state} -> {state}")
+            self.state = state
+
+    def _reconnect(self):
+        """Closes and reopens the device with exponential backoff until it works or stop() is called."""
+        self._set_state("reconnecting")
+        while not self._stop.is_set():
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+            # Jitter keeps several cameras from retrying in lockstep.
+            delay = self._backoff * random.uniform(0.8, 1.2)
+            print(f"Reconnecting in {delay:.1f}s...")
+            if self._stop.wait(delay):
+                break
+            self.reconnects += 1
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            if self.open():
+                return True
+        return False
+
+    # --- Reading ---
+    def read(self, image=None):
+        """Returns (True, frame), or (False, None) once the source has finished or was stopped."""
+        if self.cap is None and not self.open():
+            if self.is_file or not self._reconnect():
+                self._set_state("finished")
+                return False, None
+
+        while not self._stop.is_set():
+            start = time.monotonic()
+            success, frame = self.cap.read(image)
+            if success:
+                self.frames_read += 1
+                self.last_frame_time = time.time()
+                self._consecutive_failures = 0
+                self._backoff = self.initial_backoff
+                return True, frame
+
+            self.read_failures += 1
+            self._consecutive_failures += 1
+            if self.is_file:
+                # End of file: rewind once when looping, otherwise the source is done.
+                if not self.loop_file or self._consecutive_failures > 1:
+                    self._set_state("finished")
+                    return False, None
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+
+            stalled = time.monotonic() - start >= self.stall_seconds
+            if stalled or self._consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                self._consecutive_failures = 0
+                if not self._reconnect():
+                    break
+            else:
+                self._stop.wait(0.05)
+
+        return False, None
+
+    def health(self):
+        """A snapshot of the source's state and counters."""
+        return {
+            "state": self.state,
+            "reconnects": self.reconnects,
+            "read_failures": self.read_failures,
+            "frames_read": self.frames_read,
+            "seconds_since_last_frame": None if self.last_frame_time is None else time.time() - self.last_frame_time,
+            "next_backoff_seconds": self._backoff,
+        }
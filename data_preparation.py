@@ -1,6 +1,6 @@
 import sqlite3
 import pandas as pd
-import datetime
+from repository import Repository
 
 def setup_analysis_db(db_path="analysis_results.db"):
     """
@@ -39,59 +39,43 @@ def analyze_and_store_intervals(source_db="muni_detections.db", analysis_db="ana
     Analyzes bus detection intervals from a source database and stores
     aggregated results (by day, daypart, day of week) in an analysis database.
     """
-    try:
-        with sqlite3.connect(source_db) as conn:
-            query = "SELECT timestamp FROM detections ORDER BY timestamp ASC;"
-            df = pd.read_sql_query(query, conn, parse_dates=['timestamp'])
-    except (sqlite3.OperationalError, pd.io.sql.DatabaseError) as e:
-        print(f"Error accessing source database '{source_db}': {e}")
-        return
+    # One connection reads the detections and writes the attached analysis database.
+    with Repository.sqlite(source_db, analysis_db=analysis_db, forecast_db=None) as repo:
+        try:
+            df = pd.DataFrame({'timestamp': pd.to_datetime(repo.detection_timestamps())})
+        except sqlite3.OperationalError as e:
+            print(f"Error accessing source database '{source_db}': {e}")
+            return
 
-    if len(df) < 2:
-        print("Not enough detection data to calculate intervals.")
-        return
+        if len(df) < 2:
+            print("Not enough detection data to calculate intervals.")
+            return
 
-    # --- Data Enrichment and Calculation ---
-    df['interval'] = df['timestamp'].diff().dt.total_seconds()
-    df['date'] = df['timestamp'].dt.date.astype(str)
-    df['day_of_week'] = df['timestamp'].dt.day_name()
-    df['daypart'] = df['timestamp'].dt.hour.apply(get_daypart)
+        # --- Data Enrichment and Calculation ---
+        df['interval'] = df['timestamp'].diff().dt.total_seconds()
+        df['date'] = df['timestamp'].dt.date.astype(str)
+        df['day_of_week'] = df['timestamp'].dt.day_name()
+        df['daypart'] = df['timestamp'].dt.hour.apply(get_daypart)
 
-    # --- Aggregation ---
-    # Group by the new categories and calculate the average interval and count of detections
-    analysis_results = df.groupby(['date', 'day_of_week', 'daypart']).agg(
-        average_interval_seconds=('interval', 'mean'),
-        detection_count=('timestamp', 'count')
-    ).reset_index()
+        # --- Aggregation ---
+        # Group by the new categories and calculate the average interval and count of detections
+        analysis_results = df.groupby(['date', 'day_of_week', 'daypart']).agg(
+            average_interval_seconds=('interval', 'mean'),
+            detection_count=('timestamp', 'count')
+        ).reset_index()
 
-    # --- Store Results in the Analysis Database ---
-    if analysis_results.empty:
-        print("No intervals to analyze and store.")
-        return
+        # --- Store Results in the Analysis Database ---
+        if analysis_results.empty:
+            print("No intervals to analyze and store.")
+            return
 
-    print("\n--- Storing Analysis Results ---")
-    with sqlite3.connect(analysis_db) as conn:
-        cursor = conn.cursor()
-        for index, row in analysis_results.iterrows():
-            # Use UPSERT to either insert a new row or update an existing one
-            # This prevents duplicate data if the script is run multiple times.
-            upsert_query = """
-                INSERT INTO daily_analysis (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(analysis_date, day_of_week, daypart) DO UPDATE SET
-                    average_interval_seconds = excluded.average_interval_seconds,
-                    detection_count = excluded.detection_count,
-                    last_updated = excluded.last_updated;
-            """
-            cursor.execute(upsert_query, (
-                row['date'],
-                row['day_of_week'],
-                row['daypart'],
-                row['average_interval_seconds'],
-                row['detection_count'],
-                datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ))
-            print(f"  - Saved/Updated: {row['date']} ({row['day_of_week']}) - {row['daypart']}")
+        print("\n--- Storing Analysis Results ---")
+        # Use UPSERT to either insert a new row or update an existing one
+        # This prevents duplicate data if the script is run multiple times.
+        repo.upsert_daily_analysis(analysis_results.itertuples(index=False, name=None))
+        repo.commit()
+        for row in analysis_results.itertuples():
+            print(f"  - Saved/Updated: {row.date} ({row.day_of_week}) - {row.daypart}")
 
     print("--------------------------------")
     return analysis_results
@@ -1,32 +1,181 @@
+import datetime
+import functools
 import os
-import pg8000.dbapi
-from google.cloud.sql.connector import Connector, IPTypes
-from dotenv import load_dotenv
+import re
 
-load_dotenv()
+# Heavy/optional dependencies (Cloud SQL connector, pg8000, dotenv) are imported
+# on first use so that importing this module stays cheap for the web service.
+_connector = None
+_env_loaded = False
+_TIMESTAMP_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+# Applied to every SQLite connection. WAL lets the dashboard read while the
+# detector writes, and NORMAL sync is still crash-safe under WAL.
+SQLITE_SCHEMA_PRAGMAS = ["journal_mode = WAL", "synchronous = NORMAL"]
+SQLITE_PRAGMAS = ["busy_timeout = 5000", "temp_store = MEMORY", "cache_size = -16000", "mmap_size = 134217728"]
+# Compiled statements kept per connection; sqlite3 reuses one whenever the same SQL text runs again.
+SQLITE_CACHED_STATEMENTS = 256
+
+def sqlite_timestamp(value):
+    """
+    The one text form SQLite timestamps are stored and compared in. Text
+    compares character by character, so mixing it with 'T'-separated values
+    would misorder rows within a day.
+    """
+    return value.isoformat(sep=" ")
+
+def _load_env():
+    """Loads a local .env file once, if python-dotenv is installed."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+def _get_connector():
+    """Returns a process-wide Cloud SQL connector, created on first use."""
+    global _connector
+    if _connector is None:
+        from google.cloud.sql.connector import Connector
+        _connector = Connector()
+    return _connector
+
+class _SQLiteCursor:
+    """Lets SQL written for pg8000 (%s placeholders, datetime results) run against sqlite3."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _translate(query):
+        return query.replace("%s", "?")
+
+    @staticmethod
+    def _adapt(params):
+        # Store timestamps in the same sortable text form the stand-in is seeded with.
+        return tuple(sqlite_timestamp(value) if isinstance(value, datetime.datetime) else
+                     value.isoformat() if isinstance(value, datetime.date) else value
+                     for value in params or ())
+
+    def execute(self, query, params=()):
+        self._cursor.execute(self._translate(query), self._adapt(params))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(self._translate(query), [self._adapt(params) for params in seq_of_params])
+        return self
+
+    @staticmethod
+    def _convert(row):
+        # SQLite stores timestamps as text and drops declared types on aggregates
+        # like MAX(timestamp), so parse anything that looks like one.
+        if row is None:
+            return None
+        return tuple(
+            datetime.datetime.fromisoformat(value) if isinstance(value, str) and _TIMESTAMP_TEXT.match(value) else value
+            for value in row
+        )
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+class _SQLiteConnection:
+    """A SQLite connection that accepts the same SQL as the Cloud SQL one (see connect_sqlite)."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path, attach=None, tuned=True):
+        import sqlite3
+        self.path = os.path.abspath(path)
+        self._conn = sqlite3.connect(path, cached_statements=SQLITE_CACHED_STATEMENTS)
+        for schema, attached_path in (attach or {}).items():
+            self._conn.execute(f"ATTACH DATABASE ? AS {schema};", (attached_path,))
+        if tuned:
+            for schema in ["main", *(attach or {})]:
+                for pragma in SQLITE_SCHEMA_PRAGMAS:
+                    self._conn.execute(f"PRAGMA {schema}.{pragma};")
+            for pragma in SQLITE_PRAGMAS:
+                self._conn.execute(f"PRAGMA {pragma};")
+
+    def cursor(self):
+        return _SQLiteCursor(self._conn.cursor())
+
+    def execute(self, query, params=()):
+        """sqlite3-style shortcut, so the partition helpers run on this connection too."""
+        return self.cursor().execute(query, params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+def connect_sqlite(path, attach=None, tuned=True):
+    """
+    Opens a SQLite database for the same SQL the cloud runs (%s placeholders,
+    datetime results). `attach` maps schema names to further database files
+    opened on the same connection, e.g. {"analysis": "analysis_results.db"};
+    their tables can then be queried by bare name as long as names are unique.
+    `tuned=False` skips the WAL and cache pragmas (for benchmarks).
+    """
+    return _SQLiteConnection(path, attach, tuned)
 
 def get_db_connection():
     """
     Establishes a connection to the PostgreSQL database.
 
+    Local stand-ins, for offline runs and load tests, take precedence when set:
+        SQLITE_DB_PATH: a SQLite file with the same tables.
+        DB_HOST (+ DB_PORT): a plain Postgres server, connected to directly
+            with DB_USER, DB_PASS and DB_NAME instead of the Cloud SQL connector.
+
     Returns:
         A database connection object.
     """
-    connector = Connector()
-
-    # function to return the database connection object
-    def getconn() -> pg8000.dbapi.Connection:
-        conn: pg8000.dbapi.Connection = connector.connect(
-            os.environ["INSTANCE_CONNECTION_NAME"], # e.g. "project:region:instance"
-            "pg8000",
-            user=os.environ["DB_USER"], # e.g. "my-db-user"
-            password=os.environ["DB_PASS"], # e.g. "my-db-password"
-            db=os.environ["DB_NAME"], # e.g. "my-database"
-            ip_type=IPTypes.PUBLIC,  # IPTypes.PRIVATE for private IP
+    _load_env()
+    if os.environ.get("SQLITE_DB_PATH"):
+        return connect_sqlite(os.environ["SQLITE_DB_PATH"])
+    if os.environ.get("DB_HOST"):
+        import pg8000.dbapi
+        return pg8000.dbapi.connect(
+            host=os.environ["DB_HOST"],
+            port=int(os.environ.get("DB_PORT", "5432")),
+            user=os.environ["DB_USER"],
+            password=os.environ["DB_PASS"],
+            database=os.environ["DB_NAME"],
         )
-        return conn
 
-    return getconn()
+    from google.cloud.sql.connector import IPTypes
+
+    return _get_connector().connect(
+        os.environ["INSTANCE_CONNECTION_NAME"], # e.g. "project:region:instance"
+        "pg8000",
+        user=os.environ["DB_USER"], # e.g. "my-db-user"
+        password=os.environ["DB_PASS"], # e.g. "my-db-password"
+        db=os.environ["DB_NAME"], # e.g. "my-database"
+        ip_type=IPTypes.PUBLIC,  # IPTypes.PRIVATE for private IP
+    )
 
 if __name__ == "__main__":
     try:
@@ -42,13 +191,14 @@ if __name__ == "__main__":
         print("Old/test tables dropped (if they existed).")
 
         # Create the final application tables
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detections (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP NOT NULL,
-                bus_count INTEGER NOT NULL
-            );
-        """)
+        # detections is range-partitioned by month (see partitions.py)
+        from partitions import create_partitioned_detections, ensure_partitions
+        create_partitioned_detections(cursor)
+        ensure_partitions(cursor)
+        from tracing import create_traces_table
+        create_traces_table(cursor)
+        from headways import create_headway_tables
+        create_headway_tables(cursor)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS daily_analysis (
                 id SERIAL PRIMARY KEY,
@@ -70,6 +220,8 @@ if __name__ == "__main__":
                 average_interval_used REAL
             );
         """)
+        # The dashboard reads the newest forecast on every page load.
+        cursor.execute("CREATE INDEX IF NOT EXISTS arrival_forecasts_generated_idx ON arrival_forecasts (forecast_generated_at);")
         
         conn.commit()
         print("✅ Successfully created final application tables.")
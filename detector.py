@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import os
+import shutil
+import statistics
+import time
+import numpy as np
+from guardrails import trackers_of
+
+# --- CONSTANTS ---
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR", "models")
+WARMUP_RUNS = 3
+# Live frames timed after startup to compare the first frame with the steady state.
+LATENCY_SAMPLE_FRAMES = 30
+# Written (with the startup time) once the detector is warm, for external health checks.
+READY_FILE = os.environ.get("DETECTOR_READY_FILE")
+
+
+# --- WEIGHT CACHE ---
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_weights_path(weights, cache_dir=MODEL_CACHE_DIR):
+    """
+    Returns the path of `weights` inside the local cache after checking it
+    against the .sha256 file written when it was fetched. Never downloads.
+    """
+    path = os.path.join(cache_dir, os.path.basename(weights))
+    checksum_path = path + ".sha256"
+    if not os.path.exists(path) or not os.path.exists(checksum_path):
+        raise FileNotFoundError(
+            f"'{path}' is not in the model cache. Run `python detector.py --fetch {weights}` once on a networked machine."
+        )
+    with open(checksum_path) as f:
+        expected = f.read().split()[0]
+    if _sha256(path) != expected:
+        raise ValueError(f"Checksum mismatch for '{path}'. Delete it and fetch it again.")
+    return path
+
+
+def fetch_weights(weights, cache_dir=MODEL_CACHE_DIR):
+    """Copies or downloads `weights` into the cache and records its checksum."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, os.path.basename(weights))
+    if os.path.exists(weights) and os.path.abspath(weights) != os.path.abspath(path):
+        shutil.copyfile(weights, path)
+    elif not os.path.exists(path):
+        from ultralytics.utils.downloads import attempt_download_asset
+        attempt_download_asset(path)
+    with open(path + ".sha256", "w") as f:
+        f.write(f"{_sha256(path)}  {os.path.basename(path)}\n")
+    print(f"✅ Cached '{path}'.")
+    return path
+
+
+# --- DETECTOR LIFECYCLE ---
+def write_ready_file(startup_seconds, path=READY_FILE):
+    """Records the startup time for external health checks, if a ready file is configured."""
+    if path:
+        with open(path, "w") as f:
+            f.write(f"{startup_seconds:.3f}\n")
+
+
+class Detector:
+    """
+    Owns the YOLO model from cold start to ready: loads verified weights from
+    the local cache, optionally fuses Conv+BN layers, and runs warmup
+    inferences at the real frame size through the same call the live loop
+    makes (infer), so the first live frame costs the same as every later one.
+    """
+
+    def __init__(self, weights, cache_dir=MODEL_CACHE_DIR, device="cpu", imgsz=640, classes=None, track=False,
+                 fuse=True, warmup_runs=WARMUP_RUNS, ready_file=READY_FILE):
+        self.weights = weights
+        self.cache_dir = cache_dir
+        self.device = device
+        self.imgsz = imgsz
+        self.classes = list(classes) if classes is not None else None
+        # track=True runs model.track(persist=True) instead of model.predict.
+        self.track = track
+        self.fuse = fuse
+        self.warmup_runs = warmup_runs
+        self.ready_file = ready_file
+        self.model = None
+        self.startup_seconds = None
+        self.warmup_latencies = []
+        self.live_latencies = []
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def load(self):
+        from ultralytics import YOLO
+
+        self.model = YOLO(cached_weights_path(self.weights, self.cache_dir))
+        if self.fuse:
+            self.model.fuse()
+        return self.model
+
+    def _run(self, frame):
+        if self.track:
+            return self.model.track(frame, device=self.device, imgsz=self.imgsz, classes=self.classes, persist=True, verbose=False)
+        return self.model.predict(frame, device=self.device, imgsz=self.imgsz, classes=self.classes, verbose=False)
+
+    def warmup(self, frame_shape):
+        """
+        Runs inference on blank frames of `frame_shape` so lazy setup happens
+        now, not on live frames. A list of shapes warms up a batch of that
+        many images (e.g. the ROI crops), as the live calls will run it.
+        """
+        if isinstance(frame_shape, list):
+            dummy = [np.zeros(shape, dtype=np.uint8) for shape in frame_shape]
+        else:
+            dummy = np.zeros(frame_shape, dtype=np.uint8)
+        self.warmup_latencies = []
+        for _ in range(self.warmup_runs):
+            start = time.perf_counter()
+            self._run(dummy)
+            self.warmup_latencies.append(time.perf_counter() - start)
+        # The tracker is registered by now; start it clean (frame count and track IDs) for the live frames.
+        for tracker in trackers_of(self.model):
+            tracker.reset()
+
+    def start(self, frame_shape):
+        """Loads and warms up the model (see warmup for `frame_shape`), then writes the ready file. Returns the model."""
+        start = time.perf_counter()
+        self.load()
+        self.warmup(frame_shape)
+        self.startup_seconds = time.perf_counter() - start
+        write_ready_file(self.startup_seconds, self.ready_file)
+
+        latencies = ", ".join(f"{latency * 1000:.0f}" for latency in self.warmup_latencies)
+        print(f"✅ Detector ready in {self.startup_seconds:.2f}s (warmup latencies ms: {latencies}).")
+        return self.model
+
+    def infer(self, frame):
+        """
+        Runs inference on a live frame (or a list of images, one batch per
+        frame). The first LATENCY_SAMPLE_FRAMES calls are timed and then reported.
+        """
+        start = time.perf_counter()
+        results = self._run(frame)
+        if len(self.live_latencies) < LATENCY_SAMPLE_FRAMES:
+            self.live_latencies.append(time.perf_counter() - start)
+            if len(self.live_latencies) == LATENCY_SAMPLE_FRAMES:
+                self.report_latency()
+        return results
+
+    def report_latency(self):
+        """Prints the first live frame's latency against the steady state of the frames after it."""
+        first, steady = self.live_latencies[0], statistics.median(self.live_latencies[1:])
+        print(f"⏱️ First live frame {first * 1000:.0f} ms vs steady-state median {steady * 1000:.0f} ms "
+              f"over the next {len(self.live_latencies) - 1} frames ({first / steady:.2f}x).")
+        return first, steady
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local model cache.")
+    parser.add_argument("--fetch", metavar="WEIGHTS", help="Copy or download WEIGHTS into the cache (needs network if not local).")
+    parser.add_argument("--check", metavar="WEIGHTS", help="Load and warm up WEIGHTS from the cache and report startup time.")
+    parser.add_argument("--shape", default="720,1280,3", help="Frame shape used for --check warmup.")
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_weights(args.fetch)
+    if args.check:
+        Detector(args.check).start(tuple(int(n) for n in args.shape.split(",")))
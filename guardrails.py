@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+# --- CONSTANTS ---
+# Removed tracks are only consulted to de-duplicate recent IDs; older ones are dead weight.
+MAX_REMOVED_TRACKS = 200
+# Hard ceiling on tracked + lost + removed tracks before the tracker is reset outright.
+MAX_TRACKER_STATE = 1000
+PRUNE_INTERVAL_SECONDS = 60
+
+
+# --- TRACKER STATE ---
+def trackers_of(model_or_tracker):
+    """The tracker(s) behind `model.track(persist=True)`, or the tracker itself."""
+    if hasattr(model_or_tracker, "removed_stracks"):
+        return [model_or_tracker]
+    predictor = getattr(model_or_tracker, "predictor", None)
+    return list(getattr(predictor, "trackers", None) or [])
+
+
+def tracker_state_size(tracker):
+    return len(tracker.tracked_stracks) + len(tracker.lost_stracks) + len(tracker.removed_stracks)
+
+
+def prune_tracker_state(tracker, max_removed=MAX_REMOVED_TRACKS, max_state=MAX_TRACKER_STATE):
+    """Bounds a BYTETracker/BOTSORT's history in place. Returns the number of tracks dropped."""
+    before = tracker_state_size(tracker)
+    excess = len(tracker.removed_stracks) - max_removed
+    if excess > 0:
+        del tracker.removed_stracks[:excess]
+    # Lost tracks past the buffer can never be re-associated.
+    tracker.lost_stracks = [
+        track for track in tracker.lost_stracks
+        if tracker.frame_id - track.end_frame <= tracker.max_time_lost
+    ]
+    if tracker_state_size(tracker) > max_state:
+        print(f"⚠️ Tracker state reached {tracker_state_size(tracker)} tracks; resetting it.")
+        tracker.reset()
+    return before - tracker_state_size(tracker)
+
+
+class TrackerGuard:
+    """Prunes tracker state at most once per `interval_seconds`, so it can be called every frame."""
+
+    def __init__(self, interval_seconds=PRUNE_INTERVAL_SECONDS, max_removed=MAX_REMOVED_TRACKS, max_state=MAX_TRACKER_STATE):
+        self.interval_seconds = interval_seconds
+        self.max_removed = max_removed
+        self.max_state = max_state
+        self.pruned = 0
+        self._last_prune = time.monotonic()
+
+    def check(self, model_or_tracker, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_prune < self.interval_seconds:
+            return 0
+        self._last_prune = now
+        dropped = sum(prune_tracker_state(tracker, self.max_removed, self.max_state) for tracker in trackers_of(model_or_tracker))
+        self.pruned += dropped
+        return dropped
+
+
+# --- MEMORY ---
+def rss_bytes():
+    """Current resident set size. Falls back to peak RSS where no current figure is available."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux.
+        return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,169 @@
+import argparse
+import collections
+import os
+
+# --- CONSTANTS ---
+STOP_ID = os.environ.get("STOP_ID", "48-noe")
+BIN_SECONDS = 60
+# Headways of MAX_BIN minutes or more share the last (overflow) bin.
+MAX_BIN = 60
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+# --- SCHEMA ---
+def create_headway_tables(cursor):
+    """
+    headway_cube holds one row per (stop, weekday, hour): the histogram of
+    headways in one-minute bins plus its precomputed count and percentiles,
+    so readers never aggregate. headway_cube_state remembers each stop's
+    previous detection so new ones can be added incrementally.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS headway_cube (
+            stop_id TEXT NOT NULL,
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            headway_count INTEGER NOT NULL,
+            p50_minutes REAL,
+            p90_minutes REAL,
+            histogram TEXT NOT NULL,
+            PRIMARY KEY (stop_id, weekday, hour)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS headway_cube_state (
+            stop_id TEXT PRIMARY KEY,
+            last_detection TIMESTAMP NOT NULL
+        );
+    """)
+
+
+# --- HISTOGRAMS ---
+def headway_bin(seconds):
+    return min(int(seconds // BIN_SECONDS), MAX_BIN)
+
+
+def histogram_percentile(histogram, fraction):
+    """Percentile in minutes from a list of bin counts (bin midpoint; the overflow bin reports its lower edge)."""
+    threshold = fraction * sum(histogram)
+    running = 0
+    for bin_, count in enumerate(histogram):
+        running += count
+        if count and running >= threshold:
+            return float(MAX_BIN) if bin_ == MAX_BIN else bin_ + 0.5
+    return None
+
+
+def cell_row(stop_id, weekday, hour, histogram):
+    """The headway_cube row for one cell's histogram (a list of MAX_BIN + 1 counts)."""
+    return (stop_id, weekday, hour, sum(histogram), histogram_percentile(histogram, 0.5),
+            histogram_percentile(histogram, 0.9), ",".join(map(str, histogram)))
+
+
+# --- MAINTENANCE ---
+UPSERT_CELL = """
+    INSERT INTO headway_cube (stop_id, weekday, hour, headway_count, p50_minutes, p90_minutes, histogram)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (stop_id, weekday, hour) DO UPDATE SET
+        headway_count = EXCLUDED.headway_count,
+        p50_minutes = EXCLUDED.p50_minutes,
+        p90_minutes = EXCLUDED.p90_minutes,
+        histogram = EXCLUDED.histogram;
+"""
+
+
+def record_headway(cursor, timestamp, stop_id=STOP_ID):
+    """
+    Adds the headway ending at `timestamp` to its cube cell. Call it after the
+    detection has been committed, in its own transaction. If it fails,
+    headway_cube_state keeps the older detection, so the next call records one
+    inflated headway spanning the missed bus until `rebuild` runs.
+    """
+    cursor.execute("SELECT last_detection FROM headway_cube_state WHERE stop_id = %s;", (stop_id,))
+    row = cursor.fetchone()
+    if row is not None and timestamp <= row[0]:
+        return
+    if row is not None:
+        weekday, hour = timestamp.weekday(), timestamp.hour
+        cursor.execute("SELECT histogram FROM headway_cube WHERE stop_id = %s AND weekday = %s AND hour = %s;",
+                       (stop_id, weekday, hour))
+        cell = cursor.fetchone()
+        histogram = [int(count) for count in cell[0].split(",")] if cell else [0] * (MAX_BIN + 1)
+        histogram[headway_bin((timestamp - row[0]).total_seconds())] += 1
+        cursor.execute(UPSERT_CELL, cell_row(stop_id, weekday, hour, histogram))
+    cursor.execute("""
+        INSERT INTO headway_cube_state (stop_id, last_detection) VALUES (%s, %s)
+        ON CONFLICT (stop_id) DO UPDATE SET last_detection = EXCLUDED.last_detection;
+    """, (stop_id, timestamp))
+
+
+def build_cube(timestamps, stop_id=STOP_ID):
+    """headway_cube rows for ascending detection timestamps."""
+    histograms = collections.defaultdict(lambda: [0] * (MAX_BIN + 1))
+    for previous, current in zip(timestamps, timestamps[1:]):
+        histograms[(current.weekday(), current.hour)][headway_bin((current - previous).total_seconds())] += 1
+    return [cell_row(stop_id, weekday, hour, histogram) for (weekday, hour), histogram in sorted(histograms.items())]
+
+
+def rebuild_cube(conn, stop_id=STOP_ID):
+    """Recomputes a stop's cube from the raw detections. Only needed once, or after backfilling history."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT timestamp FROM detections ORDER BY timestamp ASC;")
+    timestamps = [row[0] for row in cursor.fetchall()]
+    rows = build_cube(timestamps, stop_id)
+
+    cursor.execute("DELETE FROM headway_cube WHERE stop_id = %s;", (stop_id,))
+    cursor.executemany(UPSERT_CELL, rows)
+    cursor.execute("DELETE FROM headway_cube_state WHERE stop_id = %s;", (stop_id,))
+    if timestamps:
+        cursor.execute("INSERT INTO headway_cube_state (stop_id, last_detection) VALUES (%s, %s);", (stop_id, timestamps[-1]))
+    conn.commit()
+    cursor.close()
+    print(f"✅ Rebuilt headway cube for '{stop_id}' from {len(timestamps)} detections ({len(rows)} cells).")
+
+
+# --- QUERIES ---
+def load_cube(conn, stop_id=STOP_ID):
+    """
+    Returns the stop's cube as a list of cells, one per (weekday, hour) with
+    data: at most 168 precomputed rows, whatever the size of the history.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT weekday, hour, headway_count, p50_minutes, p90_minutes, histogram
+        FROM headway_cube WHERE stop_id = %s ORDER BY weekday, hour;
+    """, (stop_id,))
+    cells = [
+        {
+            "weekday": weekday,
+            "hour": hour,
+            "count": count,
+            "p50_minutes": p50,
+            "p90_minutes": p90,
+            "histogram": [int(value) for value in histogram.split(",")],
+        }
+        for weekday, hour, count, p50, p90, histogram in cursor.fetchall()
+    ]
+    cursor.close()
+    return cells
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the precomputed headway cube.")
+    parser.add_argument("action", choices=["create", "rebuild"])
+    parser.add_argument("--stop", default=STOP_ID)
+    args = parser.parse_args()
+
+    from db import get_db_connection
+    conn = get_db_connection()
+    try:
+        if args.action == "create":
+            cursor = conn.cursor()
+            create_headway_tables(cursor)
+            conn.commit()
+            cursor.close()
+            print("✅ Headway cube tables are ready.")
+        else:
+            rebuild_cube(conn, args.stop)
+    finally:
+        conn.close()
@@ -1,12 +1,30 @@
 import datetime
-from ultralytics import YOLO
 import os
+import time
 import cv2
+import numpy as np
 import pandas as pd
-from db import get_db_connection
+from capture import CAPTURE_SOURCE, CaptureSource
+from detector import Detector
+from guardrails import TrackerGuard
+from headways import record_headway
+from parallel_inference import DEFAULT_CLASSES, ParallelDetector, make_tracker, update_tracker
+from repository import Repository
+from roi import DETECTION_ROIS, ROI_IMGSZ, RoiDetector, crop_shapes, parse_rois, plan_crops
+from tracing import DetectionTrace
 
 # --- CONSTANTS ---
 OUTPUT_DIR = 'bus_captures'
+MODEL_WEIGHTS = "yolov8m.pt"
+LOG_INTERVAL_SECONDS = 60
+PROCESS_INTERVAL_SECONDS = 0.25
+BUS_CONFIDENCE_THRESHOLD = 0.4
+# 0 runs inference in this process; N > 0 starts N worker processes fed through shared memory.
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))
+INFERENCE_DEVICE = os.environ.get("INFERENCE_DEVICE", "cpu")
+# Unexpected errors inside a loop back off from this delay, doubling up to the maximum.
+LOOP_ERROR_BACKOFF_SECONDS = 0.5
+MAX_LOOP_ERROR_BACKOFF_SECONDS = 10.0
 
 # --- HELPER FUNCTIONS (from data_preparation.py and forecast.py) ---
 def get_daypart(hour):
@@ -21,12 +39,19 @@ def get_daypart(hour):
         return "Night"
 
 # --- DATA PROCESSING FUNCTIONS ---
-def run_data_preparation(conn):
+def run_data_preparation(repo):
     """Analyzes raw detection data and stores aggregated results."""
     print("Running data preparation...")
     try:
-        # Fetch all detections
-        df = pd.read_sql_query("SELECT timestamp FROM detections ORDER BY timestamp ASC;", conn, parse_dates=['timestamp'])
+        # Only days from the last analysed date onward can have changed, so only
+        # their partitions are read. The detection just before that window is
+        # fetched too, so the window's first interval still has a predecessor.
+        window_start = repo.latest_analysis_date()
+        if window_start is None:
+            timestamps = repo.detection_timestamps()
+        else:
+            timestamps = repo.detection_timestamps(repo.last_detection_before(window_start) or window_start)
+        df = pd.DataFrame({'timestamp': pd.to_datetime(timestamps)})
 
         if len(df) < 2:
             print("Not enough data to analyze.")
@@ -34,6 +59,8 @@ def run_data_preparation(conn):
 
         # Calculate intervals and enrich data
         df['interval'] = df['timestamp'].diff().dt.total_seconds()
+        if window_start is not None:
+            df = df[df['timestamp'] >= pd.Timestamp(window_start)].copy()
         df['date'] = df['timestamp'].dt.date
         df['day_of_week'] = df['timestamp'].dt.day_name()
         df['daypart'] = df['timestamp'].dt.hour.apply(get_daypart)
@@ -49,152 +76,333 @@ def run_data_preparation(conn):
             return
 
         # Store results in the database
-        cursor = conn.cursor()
-        for _, row in analysis_results.iterrows():
-            upsert_query = """
-                INSERT INTO daily_analysis (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT(analysis_date, day_of_week, daypart) DO UPDATE SET
-                    average_interval_seconds = EXCLUDED.average_interval_seconds,
-                    detection_count = EXCLUDED.detection_count,
-                    last_updated = EXCLUDED.last_updated;
-            """
-            cursor.execute(upsert_query, (
-                row['date'],
-                row['day_of_week'],
-                row['daypart'],
-                row['average_interval_seconds'],
-                row['detection_count'],
-                datetime.datetime.now()
-            ))
-        conn.commit()
-        cursor.close()
+        repo.upsert_daily_analysis(analysis_results.itertuples(index=False, name=None))
+        repo.commit()
         print("Data preparation finished successfully.")
 
     except Exception as e:
+        repo.rollback()
         print(f"🚨 ERROR during data preparation: {e}")
 
-def run_forecasting(conn):
+def run_forecasting(repo):
     """Forecasts the next bus arrival and stores it."""
     print("Running forecasting...")
     try:
         # Get the most recent bus detection time
-        last_detection_df = pd.read_sql_query("SELECT MAX(timestamp) as last_timestamp FROM detections;", conn, parse_dates=['last_timestamp'])
-        if last_detection_df.empty or pd.isna(last_detection_df.iloc[0]['last_timestamp']):
+        last_detection_time = repo.last_detection_time()
+        if last_detection_time is None:
             print("No detections found to base forecast on.")
             return
-        last_detection_time = last_detection_df.iloc[0]['last_timestamp']
 
         # Determine current period and get average interval
         now = datetime.datetime.now()
         current_day_of_week = now.strftime('%A')
         current_daypart = get_daypart(now.hour)
 
-        query = """
-            SELECT average_interval_seconds FROM daily_analysis
-            WHERE day_of_week = %s AND daypart = %s
-            ORDER BY analysis_date DESC LIMIT 1;
-        """
-        interval_df = pd.read_sql_query(query, conn, params=(current_day_of_week, current_daypart))
-
-        if interval_df.empty:
+        avg_interval_seconds = repo.interval_for(current_day_of_week, current_daypart)
+        if avg_interval_seconds is None:
             print(f"No historical data for {current_day_of_week} - {current_daypart}. Using overall average.")
-            interval_df = pd.read_sql_query("SELECT AVG(average_interval_seconds) as avg_interval FROM daily_analysis;", conn)
-            if interval_df.empty or pd.isna(interval_df.iloc[0][0]):
+            avg_interval_seconds = repo.overall_average_interval()
+            if avg_interval_seconds is None:
                 print("No historical data at all. Cannot forecast.")
                 return
-        
-        avg_interval_seconds = interval_df.iloc[0][0]
 
         # Calculate and save the forecast
         predicted_arrival = last_detection_time + datetime.timedelta(seconds=avg_interval_seconds)
-        
-        cursor = conn.cursor()
-        insert_query = """
-            INSERT INTO arrival_forecasts (forecast_generated_at, last_bus_detected_at, predicted_arrival_at, average_interval_used)
-            VALUES (%s, %s, %s, %s);
-        """
-        cursor.execute(insert_query, (now, last_detection_time, predicted_arrival, avg_interval_seconds))
-        conn.commit()
-        cursor.close()
+        repo.insert_forecast(now, last_detection_time, predicted_arrival, avg_interval_seconds)
+        repo.commit()
         print(f"✅ Forecast saved successfully. Predicted arrival: {predicted_arrival.strftime('%I:%M:%S %p')}")
 
     except Exception as e:
+        repo.rollback()
         print(f"🚨 ERROR during forecasting: {e}")
 
-# --- MAIN APPLICATION SETUP ---
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    print("Error: Could not open webcam.")
-    exit()
+# --- DETECTION LOGGING ---
+_repository = None
 
-print("Webcam successfully opened. Starting detection...")
-model = YOLO("yolov8m.pt")
+def get_repository():
+    """The detection loop's long-lived repository; a new connection is only opened after a failure."""
+    global _repository
+    if _repository is None:
+        _repository = Repository.connect()
+    return _repository
 
-# --- Time Tracking & Control Variables ---
-last_log_time = datetime.datetime.min
-LOG_INTERVAL_SECONDS = 60
-last_process_time = datetime.datetime.min
-PROCESS_INTERVAL_SECONDS = 0.25
-annotated_frame = None
+def drop_repository():
+    """Closes the shared connection after an error; the next detection reconnects."""
+    global _repository
+    if _repository is not None:
+        try:
+            _repository.close()
+        except Exception:
+            pass
+        _repository = None
+
+def record_best_effort(repo, what, write):
+    """
+    Runs `write(cursor)` in its own transaction. Observability rows must never
+    hold up detections, so a failure (e.g. a missing table) is rolled back and logged.
+    """
+    try:
+        write(repo.cursor())
+        repo.commit()
+    except Exception as e:
+        repo.rollback()
+        print(f"⚠️ Could not record {what}: {e}")
+
+def log_bus_detection(current_time, inferred_at=None):
+    """
+    Logs a bus detection, then refreshes the analysis and forecast. Returns True once the detection is stored.
+    `current_time` is when the frame was captured; each later hop is stamped on the event's trace.
+    """
+    print(f"Bus detected at {current_time.strftime('%Y-%m-%d %H:%M:%S')}. Logging and processing...")
+    trace = DetectionTrace(current_time)
+    trace.mark("inferred_at", inferred_at)
+    try:
+        repo = get_repository()
+
+        # 1. Log the new detection in its own transaction (creating next months' partitions on a month change)
+        repo.ensure_partitions()
+        repo.insert_detection(current_time)
+        repo.commit()
+    except Exception as db_error:
+        print(f"🚨 DATABASE ERROR: {db_error}")
+        drop_repository()
+        return False
 
-# --- VIDEO PROCESSING LOOP ---
-while True:
     try:
-        success, frame = cap.read()
-        if not success:
-            continue
-
-        current_time = datetime.datetime.now()
-        if (current_time - last_process_time).total_seconds() >= PROCESS_INTERVAL_SECONDS:
-            last_process_time = current_time
-            results = model.track(frame, device="mps", classes=[2, 5], persist=True)
-            annotated_frame = results[0].plot()
-
-            bus_detected_in_frame = False
-            for box in results[0].boxes:
-                if model.names[int(box.cls[0])] == 'bus' and float(box.conf[0]) > 0.4:
-                    bus_detected_in_frame = True
+        # 2. Trace it and fold it into the headway cube, then run analysis and forecasting
+        record_best_effort(repo, "trace", trace.insert)
+        record_best_effort(repo, "headway", lambda cursor: record_headway(cursor, current_time))
+        print(f"✅ Logged new bus detection (trace {trace.trace_id}).")
+        run_data_preparation(repo)
+        record_best_effort(repo, "trace hop", lambda cursor: trace.record(cursor, "prepared_at"))
+        run_forecasting(repo)
+        record_best_effort(repo, "trace hop", lambda cursor: trace.record(cursor, "forecasted_at"))
+    except Exception as db_error:
+        # The detection is already stored, so it must not be logged again.
+        print(f"🚨 DATABASE ERROR: {db_error}")
+        drop_repository()
+    return True
+
+# --- VIDEO PROCESSING LOOPS ---
+def pause_after_error(error, consecutive_errors):
+    """
+    Logs an unexpected loop error and sleeps a bounded, growing interval.
+    Device failures never get here (CaptureSource handles them), so this
+    only keeps a persistent bug from spinning the loop.
+    """
+    delay = min(LOOP_ERROR_BACKOFF_SECONDS * 2 ** (consecutive_errors - 1), MAX_LOOP_ERROR_BACKOFF_SECONDS)
+    print(f"🚨🚨🚨 AN UNEXPECTED ERROR OCCURRED: {error} (retrying in {delay:.1f}s)")
+    time.sleep(delay)
+
+def save_snapshot(frame, current_time):
+    """Writes a logged detection's annotated frame to OUTPUT_DIR."""
+    path = os.path.join(OUTPUT_DIR, f"bus_{current_time.strftime('%Y%m%d_%H%M%S')}.jpg")
+    cv2.imwrite(path, frame)
+    return path
+
+def draw_tracks(frame, tracks, names):
+    """Draws tracked boxes onto `frame` in place. Boxes the tracker has not confirmed yet (ID -1) get no ID."""
+    for x1, y1, x2, y2, track_id, conf, cls, _ in tracks:
+        label = f"{names[int(cls)]} #{int(track_id)} {conf:.2f}" if track_id >= 0 else f"{names[int(cls)]} {conf:.2f}"
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 200, 0), 2)
+        cv2.putText(frame, label, (int(x1), max(int(y1) - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 0), 1)
+    return frame
+
+def result_tracks(result):
+    """A track(persist=True) result as update_tracker's (N, 8) rows; untracked boxes get ID -1."""
+    boxes = result.boxes
+    ids = boxes.id.cpu().numpy() if boxes.id is not None else np.full(len(boxes), -1.0)
+    columns = [boxes.xyxy.cpu().numpy(), ids, boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(), np.arange(len(boxes))]
+    return np.column_stack(columns).reshape(-1, 8)
+
+def show_frame(frame):
+    """Displays a frame. Returns True when 'q' was pressed."""
+    cv2.imshow("Webcam Bus Detection", frame)
+    if cv2.waitKey(1) & 0xFF == ord("q"):
+        print("'q' pressed, stopping detection.")
+        return True
+    return False
+
+class FrameStage:
+    """
+    The per-frame step every detection loop shares once inference is done:
+    tracker, bus check, logging (with an optional snapshot) and annotation.
+    Give it a `tracker` to track raw (N, 6) detections here, or the `model`
+    when the model tracks for itself and hands over (N, 8) tracks.
+    """
+
+    def __init__(self, names, tracker=None, model=None, overlay=None, snapshots=False, log=log_bus_detection):
+        self.names = names
+        self.tracker = tracker
+        # persist=True and standalone trackers alike keep state across frames; keep its history bounded.
+        self.guarded = tracker if tracker is not None else model
+        self.tracker_guard = TrackerGuard()
+        self.overlay = overlay
+        self.snapshots = snapshots
+        self.log = log
+        self.last_log_time = datetime.datetime.min
+
+    def bus_in(self, tracks):
+        return any(self.names[int(cls)] == 'bus' and conf > BUS_CONFIDENCE_THRESHOLD for cls, conf in zip(tracks[:, 6], tracks[:, 5]))
+
+    def process(self, frame, current_time, detections):
+        """Runs the shared step on one inferred frame and returns it annotated (a copy)."""
+        inferred_at = datetime.datetime.now()
+        tracks = update_tracker(self.tracker, frame, detections) if self.tracker is not None else detections
+        self.tracker_guard.check(self.guarded)
+        annotated = frame.copy()
+        if self.overlay:
+            self.overlay(annotated)
+        draw_tracks(annotated, tracks, self.names)
+
+        if self.bus_in(tracks) and (current_time - self.last_log_time).total_seconds() >= LOG_INTERVAL_SECONDS:
+            if self.log(current_time, inferred_at):
+                self.last_log_time = current_time
+                if self.snapshots:
+                    save_snapshot(annotated, current_time)
+        return annotated
+
+def run_sampled_loop(cap, infer, stage, show=show_frame, clock=datetime.datetime.now):
+    """
+    Runs `infer(frame)` on one captured frame every PROCESS_INTERVAL_SECONDS,
+    hands the result to `stage` and shows the newest annotated frame. The soak
+    test swaps `show` and `clock` to replay footage headless and at full speed.
+    """
+    last_process_time = datetime.datetime.min
+    annotated_frame = None
+    consecutive_errors = 0
+
+    while True:
+        try:
+            # Blocks (without spinning) through device outages; only fails when the source is done.
+            success, frame = cap.read()
+            if not success:
+                print(f"Capture source finished: {cap.health()}")
+                break
+
+            current_time = clock()
+            if (current_time - last_process_time).total_seconds() >= PROCESS_INTERVAL_SECONDS:
+                last_process_time = current_time
+                annotated_frame = stage.process(frame, current_time, infer(frame))
+
+            if show(annotated_frame if annotated_frame is not None else frame):
+                break
+            consecutive_errors = 0
+
+        except Exception as e:
+            consecutive_errors += 1
+            pause_after_error(e, consecutive_errors)
+
+def start_detection(frame_shape, device="mps"):
+    """Starts the in-process tracking detector. Returns (infer, stage) for run_sampled_loop."""
+    # Warmup goes through the same track(persist=True) call as the loop.
+    detector = Detector(MODEL_WEIGHTS, device=device, classes=[2, 5], track=True)
+    model = detector.start(frame_shape)
+    return (lambda frame: result_tracks(detector.infer(frame)[0])), FrameStage(model.names, model=model)
+
+def run_detection_loop(cap):
+    """Runs tracking in this process, one sampled frame at a time."""
+    success, frame = cap.read()
+    if not success:
+        print("Error: Could not read a first frame to warm up the detector.")
+        return
+    run_sampled_loop(cap, *start_detection(frame.shape))
+
+def run_parallel_detection_loop(cap, workers):
+    """
+    Runs detection on a pool of worker processes. Frames are decoded straight
+    into shared-memory slots; results come back in capture order to a single
+    tracker/logger stage in this process.
+    """
+    success, frame = cap.read()
+    if not success:
+        print("Error: Could not read a first frame to size the frame buffers.")
+        return
+
+    consecutive_errors = 0
+
+    with ParallelDetector(MODEL_WEIGHTS, frame.shape, workers=workers, device=INFERENCE_DEVICE) as detector:
+        stage = FrameStage(detector.names, tracker=make_tracker())
+        while True:
+            try:
+                # --- Capture stage: fill every free slot ---
+                slot = detector.free_slot()
+                if slot is not None:
+                    target = detector.frame(slot)
+                    success, frame = cap.read(target)
+                    if not success:
+                        print(f"Capture source finished: {cap.health()}")
+                        detector.release(slot)
+                        break
+                    if frame is not target:
+                        # The device changed resolution or returned a new buffer.
+                        target[...] = cv2.resize(frame, (target.shape[1], target.shape[0]))
+                    detector.submit(slot, datetime.datetime.now())
+
+                # --- Tracker/logger stage: consume results in order ---
+                stop = False
+                for current_time, frame, detections in detector.collect(block=slot is None):
+                    if show_frame(stage.process(frame, current_time, detections)):
+                        stop = True
+                        break
+                if stop:
                     break
-            
-            if bus_detected_in_frame and (current_time - last_log_time).total_seconds() >= LOG_INTERVAL_SECONDS:
-                print(f"Bus detected at {current_time.strftime('%Y-%m-%d %H:%M:%S')}. Logging and processing...")
-                conn = None
-                try:
-                    conn = get_db_connection()
-                    
-                    # 1. Log the new detection
-                    cursor = conn.cursor()
-                    cursor.execute("INSERT INTO detections (timestamp, bus_count) VALUES (%s, %s)", (current_time, 1))
-                    conn.commit()
-                    cursor.close()
-                    print("✅ Logged new bus detection.")
-                    last_log_time = current_time
-
-                    # 2. Run analysis and forecasting
-                    run_data_preparation(conn)
-                    run_forecasting(conn)
-
-                except Exception as db_error:
-                    print(f"🚨 DATABASE ERROR: {db_error}")
-                finally:
-                    if conn:
-                        conn.close()
-
-        # Display the frame
-        display_frame = annotated_frame if annotated_frame is not None else frame
-        cv2.imshow("Webcam Bus Detection", display_frame)
-
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            print("'q' pressed, stopping detection.")
-            break
+                consecutive_errors = 0
 
-    except Exception as e:
-        print(f"🚨🚨🚨 AN UNEXPECTED ERROR OCCURRED: {e}")
-        cv2.waitKey(5000)
+            except Exception as e:
+                consecutive_errors += 1
+                pause_after_error(e, consecutive_errors)
+
+def start_roi_detection(frame_shape, rois, device=INFERENCE_DEVICE):
+    """Starts detection on the regions of interest at ROI_IMGSZ. Returns (infer, stage) for run_sampled_loop."""
+    crops = plan_crops(rois, frame_shape)
+    # Like the worker pool, the ROI path runs on INFERENCE_DEVICE rather than the full-frame loop's "mps".
+    # Warmup runs the same batch of crops as every live frame.
+    detector = Detector(MODEL_WEIGHTS, device=device, imgsz=ROI_IMGSZ, classes=DEFAULT_CLASSES)
+    detector.start(crop_shapes(crops))
+    roi_detector = RoiDetector(detector, crops)
+    print(f"Detecting in {len(crops)} crop(s) at imgsz={ROI_IMGSZ} on device {device!r} (INFERENCE_DEVICE): {crops}")
+    stage = FrameStage(roi_detector.names, tracker=make_tracker(), overlay=roi_detector.draw_regions, snapshots=True)
+    return roi_detector.detect, stage
 
-# --- CLEANUP ---
-print("Cleaning up and closing resources.")
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+def run_roi_detection_loop(cap, rois):
+    """
+    Runs detection on the configured regions of interest only, at ROI_IMGSZ.
+    Boxes come back in full-frame coordinates, so tracking, snapshots and the
+    display work on the whole frame as usual.
+    """
+    success, frame = cap.read()
+    if not success:
+        print("Error: Could not read a first frame to place the regions of interest.")
+        return
+    run_sampled_loop(cap, *start_roi_detection(frame.shape, rois))
+
+# --- MAIN APPLICATION SETUP ---
+if __name__ == "__main__":
+    if DETECTION_ROIS and INFERENCE_WORKERS > 0:
+        # The ROI path runs in this process; refuse rather than silently ignore the worker pool.
+        raise SystemExit("Error: DETECTION_ROIS and INFERENCE_WORKERS cannot be combined; unset one of them.")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    cap = CaptureSource(CAPTURE_SOURCE)
+    if cap.open():
+        print(f"Capture source {CAPTURE_SOURCE!r} opened. Starting detection...")
+    elif cap.is_file:
+        # Files are not retried: read() reports them finished straight away.
+        raise SystemExit(f"Error: Could not open video file {CAPTURE_SOURCE!r}.")
+    else:
+        print(f"Capture source {CAPTURE_SOURCE!r} is not available yet; it will be retried with backoff.")
+    try:
+        if DETECTION_ROIS:
+            run_roi_detection_loop(cap, parse_rois(DETECTION_ROIS))
+        elif INFERENCE_WORKERS > 0:
+            run_parallel_detection_loop(cap, INFERENCE_WORKERS)
+        else:
+            run_detection_loop(cap)
+    finally:
+        # --- CLEANUP ---
+        print("Cleaning up and closing resources.")
+        cap.release()
+        if _repository is not None:
+            _repository.close()
+        cv2.destroyAllWindows()
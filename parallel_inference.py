@@ -0,0 +1,254 @@
+import os
+import heapq
+import queue
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# --- CONSTANTS ---
+DEFAULT_CLASSES = (2, 5)  # COCO 'car' and 'bus'
+RESULT_TIMEOUT_SECONDS = 30
+# How often start() checks that the workers it is waiting for are still alive.
+READY_POLL_SECONDS = 1
+
+
+# --- SHARED FRAME BUFFERS ---
+class FrameRing:
+    """
+    A fixed number of equally sized frame slots backed by a single
+    shared-memory block. The capture process writes frames straight into a
+    slot and workers read them in place, so frames are never pickled.
+    """
+
+    def __init__(self, slots, frame_shape, dtype=np.uint8, name=None):
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_nbytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.frame_nbytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray((slots, *self.frame_shape), dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        """Everything a worker process needs to attach to this ring."""
+        return (self.shm.name, self.slots, self.frame_shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, frame_shape, dtype = spec
+        return cls(slots, frame_shape, dtype=dtype, name=name)
+
+    def frame(self, slot):
+        return self.array[slot]
+
+    def close(self):
+        # The numpy view must be dropped before the buffer can be released.
+        self.array = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+# --- WORKER PROCESS ---
+def _inference_worker(ring_spec, weights, classes, device, imgsz, threads, tasks, results, ready):
+    """Loads the detector once, then runs inference on ring slots until told to stop."""
+    # Each worker gets its share of the cores instead of every worker
+    # spawning a full-size thread pool and oversubscribing the machine.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    import torch
+    from detector import Detector
+
+    torch.set_num_threads(threads)
+    ring = FrameRing.attach(ring_spec)
+    # Warm up before reporting ready so the pool never sees a cold first frame.
+    # The pool writes the ready file once every worker is warm, not each worker on its own.
+    detector = Detector(weights, device=device, imgsz=imgsz, classes=classes, ready_file=None)
+    detector.start(ring.frame_shape)
+    ready.put(detector.names)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot = task
+            result = detector.infer(ring.frame(slot))[0]
+            # Only the small (N, 6) [x1, y1, x2, y2, conf, cls] array crosses the process boundary.
+            results.put((seq, slot, result.boxes.data.cpu().numpy()))
+    finally:
+        ring.close()
+
+
+# --- PARALLEL DETECTOR ---
+class ParallelDetector:
+    """
+    A pool of inference worker processes fed through a FrameRing.
+
+    Usage from the capture process:
+        slot = detector.free_slot()       # None when every slot is in flight
+        cap.read(detector.frame(slot))    # decode straight into shared memory
+        detector.submit(slot, payload)
+        for payload, frame, detections in detector.collect():
+            ...                           # results arrive in submission order
+
+    A frame handed out by collect() stays valid until the loop advances,
+    after which its slot is recycled.
+    """
+
+    def __init__(self, weights, frame_shape, workers=None, slots=None,
+                 classes=DEFAULT_CLASSES, device="cpu", imgsz=640):
+        self.weights = weights
+        self.frame_shape = tuple(frame_shape)
+        self.workers = workers or os.cpu_count() or 1
+        # Two slots per worker keeps every worker busy while the previous
+        # result is still being consumed by the tracker/logger stage.
+        self.slots = slots or self.workers * 2
+        self.classes = tuple(classes)
+        self.device = device
+        self.imgsz = imgsz
+        self.names = {}
+        self.ring = None
+        self._procs = []
+        self._free = []
+        self._pending = {}
+        self._ready = []
+        self._next_seq = 0
+        self._next_emit = 0
+
+    def start(self):
+        from detector import write_ready_file
+
+        started = time.perf_counter()
+        ctx = mp.get_context("spawn")
+        self.ring = FrameRing(self.slots, self.frame_shape)
+        self._free = list(range(self.slots))
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        ready = ctx.Queue()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+
+        for _ in range(self.workers):
+            proc = ctx.Process(
+                target=_inference_worker,
+                args=(self.ring.spec, self.weights, self.classes, self.device, self.imgsz,
+                      threads, self._tasks, self._results, ready),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        waiting = len(self._procs)
+        while waiting:
+            try:
+                self.names = ready.get(timeout=READY_POLL_SECONDS)
+                waiting -= 1
+            except queue.Empty:
+                # A worker that fails to load (e.g. weights not fetched yet) never reports ready.
+                dead = [proc for proc in self._procs if not proc.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"An inference worker exited while loading the model (exit code {dead[0].exitcode}).")
+        startup_seconds = time.perf_counter() - started
+        write_ready_file(startup_seconds)
+        print(f"✅ {self.workers} inference workers ready in {startup_seconds:.2f}s ({self.slots} shared frame slots).")
+        return self
+
+    def free_slot(self):
+        """Returns the index of an unused slot, or None if all are in flight."""
+        return self._free.pop() if self._free else None
+
+    def release(self, slot):
+        """Returns an unsubmitted slot to the pool (e.g. after a failed read)."""
+        self._free.append(slot)
+
+    def frame(self, slot):
+        return self.ring.frame(slot)
+
+    def submit(self, slot, payload=None):
+        """Queues the frame in `slot` for inference. `payload` is returned with its result."""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._pending[seq] = payload
+        self._tasks.put((seq, slot))
+        return seq
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def _receive(self, block):
+        try:
+            item = self._results.get(block=block, timeout=RESULT_TIMEOUT_SECONDS if block else None)
+        except queue.Empty:
+            if block and not all(proc.is_alive() for proc in self._procs):
+                raise RuntimeError("An inference worker exited unexpectedly.")
+            return False
+        heapq.heappush(self._ready, item)
+        return True
+
+    def collect(self, block=False):
+        """
+        Yields (payload, frame, detections) in submission order.
+        With block=True, waits until at least the next in-order result is available.
+        """
+        while self._receive(block=False):
+            pass
+        if block and self._pending:
+            while not self._ready or self._ready[0][0] != self._next_emit:
+                self._receive(block=True)
+
+        while self._ready and self._ready[0][0] == self._next_emit:
+            seq, slot, detections = heapq.heappop(self._ready)
+            self._next_emit += 1
+            payload = self._pending.pop(seq)
+            try:
+                yield payload, self.ring.frame(slot), detections
+            finally:
+                self._free.append(slot)
+
+    def close(self):
+        for _ in self._procs:
+            self._tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# --- TRACKER STAGE ---
+def make_tracker(tracker_config="bytetrack.yaml", frame_rate=30):
+    """Builds the same tracker `model.track(persist=True)` uses, for the single ordered stage."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_config)))
+    return BYTETracker(args=cfg, frame_rate=frame_rate)
+
+
+def update_tracker(tracker, frame, detections):
+    """
+    Feeds one frame's detections to the tracker.
+    Returns an (N, 8) array of [x1, y1, x2, y2, track_id, conf, cls, idx].
+    """
+    from ultralytics.engine.results import Boxes
+
+    # With no active tracks BYTETracker returns a flat empty array; keep the (0, 8) shape callers index into.
+    return np.asarray(tracker.update(Boxes(detections, frame.shape[:2]), frame)).reshape(-1, 8)
@@ -0,0 +1,339 @@
+import argparse
+import datetime
+import re
+from db import sqlite_timestamp
+
+# --- CONSTANTS ---
+PARENT_TABLE = "detections"
+MONTHS_AHEAD = 2
+PARTITION_NAME = re.compile(r"^detections_(\d{4})_(\d{2})$")
+# SQLite month tables also keep the edge schema's columns, so migrating the edge table loses nothing.
+SQLITE_EDGE_COLUMNS = {"detected_object": "TEXT", "confidence": "REAL", "image_path": "TEXT", "tracking_id": "INTEGER"}
+
+
+class PartitionCache:
+    """
+    What one connection already knows about its database's partitions, so
+    repeated ensure calls skip the catalog. Keep one per connection (the
+    Repository does); without one, every call checks the database.
+    """
+
+    def __init__(self):
+        self.partitioned = None
+        self.months = set()
+
+
+# --- MONTH HELPERS ---
+def month_start(value):
+    """First day of the month containing `value` (a date or datetime)."""
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _as_datetime(month):
+    return datetime.datetime.combine(month, datetime.time.min)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def months_between(start, end):
+    """All month starts from the month of `start` up to and including the month of `end`."""
+    month, last = month_start(start), month_start(end)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+# --- POSTGRES ---
+def create_partitioned_detections(cursor):
+    """Creates the detections table range-partitioned by month on `timestamp`."""
+    # The partition key must be part of every unique constraint on a partitioned table.
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PARENT_TABLE} (
+            id SERIAL,
+            timestamp TIMESTAMP NOT NULL,
+            bus_count INTEGER NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """)
+    # Defined once on the parent, created automatically on every partition.
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {PARENT_TABLE}_timestamp_idx ON {PARENT_TABLE} (timestamp);")
+
+
+def ensure_partitions(cursor, today=None, months_ahead=MONTHS_AHEAD, cache=None):
+    """
+    Creates the partitions for the current month and the next `months_ahead`
+    months if they don't exist yet. Cheap to call often with the connection's
+    PartitionCache: months it has already ensured are skipped without
+    touching the database.
+    """
+    cache = cache or PartitionCache()
+    if cache.partitioned is None:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s;", (PARENT_TABLE,))
+        row = cursor.fetchone()
+        cache.partitioned = row is not None and row[0] == "p"
+        if not cache.partitioned:
+            print(f"⚠️ '{PARENT_TABLE}' is not partitioned yet; run `python partitions.py migrate`.")
+    if not cache.partitioned:
+        return []
+
+    today = today or datetime.date.today()
+    created = []
+    for month in months_between(today, add_months(month_start(today), months_ahead)):
+        if month in cache.months:
+            continue
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE}
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}');
+        """)
+        cache.months.add(month)
+        created.append(partition_name(month))
+    return created
+
+
+def list_partitions(cursor):
+    """Returns [(month, table name)] for the partitions currently attached to detections, oldest first."""
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = %s;
+    """, (PARENT_TABLE,))
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((datetime.date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def retire_partitions(conn, keep_months, mode="detach", today=None):
+    """
+    Retires partitions older than the last `keep_months` months.
+    mode="detach" keeps each one as a standalone table (e.g. to archive with
+    pg_dump); mode="drop" deletes it. Either way it is a catalog operation,
+    not a row-by-row DELETE.
+    """
+    cutoff = add_months(month_start(today or datetime.date.today()), -keep_months)
+    cursor = conn.cursor()
+    retired = []
+    for month, name in list_partitions(cursor):
+        if month >= cutoff:
+            continue
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name};")
+        if mode == "drop":
+            cursor.execute(f"DROP TABLE {name};")
+        retired.append(name)
+    conn.commit()
+    cursor.close()
+    return retired
+
+
+def migrate_to_partitioned(conn):
+    """Moves an existing unpartitioned detections table into the partitioned layout."""
+    cursor = conn.cursor()
+    cursor.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {PARENT_TABLE}_unpartitioned;")
+    # The old SERIAL's sequence and primary key keep their names; free them up.
+    cursor.execute(f"ALTER SEQUENCE IF EXISTS {PARENT_TABLE}_id_seq RENAME TO {PARENT_TABLE}_unpartitioned_id_seq;")
+    cursor.execute(f"ALTER INDEX IF EXISTS {PARENT_TABLE}_pkey RENAME TO {PARENT_TABLE}_unpartitioned_pkey;")
+    create_partitioned_detections(cursor)
+
+    cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {PARENT_TABLE}_unpartitioned;")
+    first, last = cursor.fetchone()
+    today = datetime.date.today()
+    cache = PartitionCache()
+    for month in months_between(first or today, last or today):
+        ensure_partitions(cursor, today=month, months_ahead=0, cache=cache)
+    ensure_partitions(cursor, cache=cache)
+
+    cursor.execute(f"INSERT INTO {PARENT_TABLE} (timestamp, bus_count) SELECT timestamp, bus_count FROM {PARENT_TABLE}_unpartitioned;")
+    moved = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    print(f"✅ Moved {moved} detections into monthly partitions. The old table is kept as {PARENT_TABLE}_unpartitioned.")
+
+
+# --- SQLITE SIMULATION ---
+# SQLite has no declarative partitioning, so each month is its own table and
+# a `detections` view unions them for readers. Writes go through
+# sqlite_insert_detection() and reads through sqlite_select_range(),
+# sqlite_range_summary() and sqlite_last_detection(), which only touch the
+# months a query overlaps (the Repository does both when it finds the view).
+def sqlite_ensure_partition(conn, month):
+    name = partition_name(month_start(month))
+    edge_columns = "".join(f", {column} {kind}" for column, kind in SQLITE_EDGE_COLUMNS.items())
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            bus_count INTEGER NOT NULL DEFAULT 1{edge_columns}
+        );
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_timestamp_idx ON {name} (timestamp);")
+    return name
+
+
+def sqlite_list_partitions(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'detections\\_%' ESCAPE '\\';").fetchall()
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((datetime.date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def sqlite_refresh_view(conn):
+    """Recreates the `detections` view over all month tables."""
+    conn.execute(f"DROP VIEW IF EXISTS {PARENT_TABLE};")
+    partitions = sqlite_list_partitions(conn)
+    if partitions:
+        columns = ", ".join(["timestamp", "bus_count", *SQLITE_EDGE_COLUMNS])
+        union = " UNION ALL ".join(f"SELECT {columns} FROM {name}" for _, name in partitions)
+        conn.execute(f"CREATE VIEW {PARENT_TABLE} AS {union};")
+
+
+def sqlite_is_partitioned(conn):
+    """Whether `detections` is the view over month tables rather than a plain table."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?;", (PARENT_TABLE,)).fetchone()
+    return row is not None and row[0] == "view"
+
+
+def sqlite_insert_detection(conn, timestamp, bus_count=1, cache=None, **edge_values):
+    """
+    Routes a detection to its month table, creating the table (and refreshing
+    the view) on a new month. `edge_values` fills the SQLITE_EDGE_COLUMNS.
+    """
+    month = month_start(timestamp)
+    name = partition_name(month)
+    if cache is None or month not in cache.months:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (name,)).fetchone():
+            sqlite_ensure_partition(conn, month)
+            sqlite_refresh_view(conn)
+        if cache is not None:
+            cache.months.add(month)
+    columns = ["timestamp", "bus_count", *edge_values]
+    values = [sqlite_timestamp(timestamp), bus_count, *edge_values.values()]
+    conn.execute(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});", values)
+
+
+def _sqlite_range_union(conn, start, end, columns):
+    """A UNION ALL over just the month tables overlapping [start, end) (either bound may be None), and its params."""
+    names = [name for month, name in sqlite_list_partitions(conn)
+             if (start is None or _as_datetime(add_months(month, 1)) > start) and (end is None or _as_datetime(month) < end)]
+    conditions, bounds = [], []
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        bounds.append(sqlite_timestamp(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        bounds.append(sqlite_timestamp(end))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = " UNION ALL ".join(f"SELECT {columns} FROM {name}{where}" for name in names)
+    return query, bounds * len(names)
+
+
+def sqlite_select_range(conn, start=None, end=None, columns="timestamp"):
+    """Rows with start <= timestamp < end, ascending, reading only the month tables the range overlaps."""
+    query, params = _sqlite_range_union(conn, start, end, columns)
+    if not query:
+        return []
+    return conn.execute(query + " ORDER BY timestamp ASC;", params).fetchall()
+
+
+def sqlite_range_summary(conn, start, end):
+    """(count, first, last) of the detections in [start, end), from the overlapping month tables only."""
+    query, params = _sqlite_range_union(conn, start, end, "timestamp")
+    if not query:
+        return (0, None, None)
+    return tuple(conn.execute(f"SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM ({query});", params).fetchone())
+
+
+def sqlite_last_detection(conn, before=None):
+    """
+    The newest timestamp (before `before`, if given), probing month tables
+    newest first so that normally only the current month's index is read.
+    """
+    for month, name in reversed(sqlite_list_partitions(conn)):
+        if before is None:
+            row = conn.execute(f"SELECT MAX(timestamp) FROM {name};").fetchone()
+        elif _as_datetime(month) < before:
+            row = conn.execute(f"SELECT MAX(timestamp) FROM {name} WHERE timestamp < ?;", (sqlite_timestamp(before),)).fetchone()
+        else:
+            continue
+        if row[0] is not None:
+            return row[0]
+    return None
+
+
+def sqlite_retire_partitions(conn, keep_months, today=None):
+    """Drops month tables older than the last `keep_months` months."""
+    cutoff = add_months(month_start(today or datetime.date.today()), -keep_months)
+    retired = [name for month, name in sqlite_list_partitions(conn) if month < cutoff]
+    for name in retired:
+        conn.execute(f"DROP TABLE {name};")
+    sqlite_refresh_view(conn)
+    conn.commit()
+    return retired
+
+
+def sqlite_migrate_to_partitioned(conn):
+    """Splits an existing SQLite detections table into month tables behind a view, keeping every column."""
+    conn.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {PARENT_TABLE}_unpartitioned;")
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({PARENT_TABLE}_unpartitioned);").fetchall()]
+    edge_columns = [column for column in SQLITE_EDGE_COLUMNS if column in existing]
+    bus_count = "bus_count" if "bus_count" in existing else "1"
+    rows = conn.execute(f"SELECT timestamp, {', '.join([bus_count, *edge_columns])} "
+                        f"FROM {PARENT_TABLE}_unpartitioned ORDER BY timestamp ASC;").fetchall()
+    cache = PartitionCache()
+    for timestamp, count, *values in rows:
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+        sqlite_insert_detection(conn, timestamp, count, cache, **dict(zip(edge_columns, values)))
+    conn.commit()
+    print(f"✅ Moved {len(rows)} detections into monthly SQLite tables. The old table is kept as {PARENT_TABLE}_unpartitioned.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the detections table.")
+    parser.add_argument("action", choices=["ensure", "migrate", "retire"])
+    parser.add_argument("--sqlite", metavar="DB_PATH", help="Operate on the SQLite simulation in DB_PATH instead of Cloud SQL.")
+    parser.add_argument("--keep-months", type=int, default=12, help="Months kept by 'retire'.")
+    parser.add_argument("--mode", choices=["detach", "drop"], default="detach", help="What 'retire' does on Postgres.")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        import sqlite3
+        conn = sqlite3.connect(args.sqlite)
+        if args.action == "migrate":
+            sqlite_migrate_to_partitioned(conn)
+        elif args.action == "retire":
+            print(f"Dropped: {sqlite_retire_partitions(conn, args.keep_months)}")
+        else:
+            for month in months_between(datetime.date.today(), add_months(datetime.date.today(), MONTHS_AHEAD)):
+                sqlite_ensure_partition(conn, month)
+            sqlite_refresh_view(conn)
+            conn.commit()
+        conn.close()
+    else:
+        from db import get_db_connection
+        conn = get_db_connection()
+        try:
+            if args.action == "migrate":
+                migrate_to_partitioned(conn)
+            elif args.action == "retire":
+                print(f"Retired ({args.mode}): {retire_partitions(conn, args.keep_months, args.mode)}")
+            else:
+                cursor = conn.cursor()
+                print(f"Created: {ensure_partitions(cursor)}")
+                conn.commit()
+                cursor.close()
+        finally:
+            conn.close()
@@ -1,6 +1,6 @@
 import datetime
 import pandas as pd
-from db import get_db_connection
+from repository import Repository
 
 # --- HELPER FUNCTIONS (from main.py) ---
 def get_daypart(hour):
@@ -15,11 +15,11 @@ def get_daypart(hour):
         return "Night"
 
 # --- DATA PROCESSING FUNCTIONS (from main.py) ---
-def run_data_preparation(conn):
+def run_data_preparation(repo):
     """Analyzes raw detection data and stores aggregated results."""
     print("Running data preparation on cloud data...")
     try:
-        df = pd.read_sql_query("SELECT timestamp FROM detections ORDER BY timestamp ASC;", conn, parse_dates=['timestamp'])
+        df = pd.DataFrame({'timestamp': pd.to_datetime(repo.detection_timestamps())})
         if len(df) < 2:
             print("Not enough data to analyze.")
             return
@@ -38,72 +38,54 @@ def run_data_preparation(conn):
             print("No intervals to store.")
             return
 
-        cursor = conn.cursor()
-        for _, row in analysis_results.iterrows():
-            upsert_query = """
-                INSERT INTO daily_analysis (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT(analysis_date, day_of_week, daypart) DO UPDATE SET
-                    average_interval_seconds = EXCLUDED.average_interval_seconds,
-                    detection_count = EXCLUDED.detection_count,
-                    last_updated = EXCLUDED.last_updated;
-            """
-            cursor.execute(upsert_query, (row['date'], row['day_of_week'], row['daypart'], row['average_interval_seconds'], row['detection_count'], datetime.datetime.now()))
-        conn.commit()
-        cursor.close()
+        repo.upsert_daily_analysis(analysis_results.itertuples(index=False, name=None))
+        repo.commit()
         print(f"✅ Data preparation finished. {len(analysis_results)} analysis records upserted.")
 
     except Exception as e:
+        repo.rollback()
         print(f"🚨 ERROR during data preparation: {e}")
 
-def run_forecasting(conn):
+def run_forecasting(repo):
     """Forecasts the next bus arrival and stores it."""
     print("Running forecasting on cloud data...")
     try:
-        last_detection_df = pd.read_sql_query("SELECT MAX(timestamp) as last_timestamp FROM detections;", conn, parse_dates=['last_timestamp'])
-        if last_detection_df.empty or pd.isna(last_detection_df.iloc[0]['last_timestamp']):
+        last_detection_time = repo.last_detection_time()
+        if last_detection_time is None:
             print("No detections found to base forecast on.")
             return
-        last_detection_time = last_detection_df.iloc[0]['last_timestamp']
 
         now = datetime.datetime.now()
         current_day_of_week = now.strftime('%A')
         current_daypart = get_daypart(now.hour)
 
-        query = "SELECT average_interval_seconds FROM daily_analysis WHERE day_of_week = %s AND daypart = %s ORDER BY analysis_date DESC LIMIT 1;"
-        interval_df = pd.read_sql_query(query, conn, params=(current_day_of_week, current_daypart))
-
-        if interval_df.empty:
+        avg_interval_seconds = repo.interval_for(current_day_of_week, current_daypart)
+        if avg_interval_seconds is None:
             print(f"No historical data for {current_day_of_week} - {current_daypart}. Using overall average.")
-            interval_df = pd.read_sql_query("SELECT AVG(average_interval_seconds) as avg_interval FROM daily_analysis;", conn)
-            if interval_df.empty or pd.isna(interval_df.iloc[0][0]):
+            avg_interval_seconds = repo.overall_average_interval()
+            if avg_interval_seconds is None:
                 print("No historical data at all. Cannot forecast.")
                 return
-        
-        avg_interval_seconds = interval_df.iloc[0][0]
 
         predicted_arrival = last_detection_time + datetime.timedelta(seconds=avg_interval_seconds)
-        
-        cursor = conn.cursor()
-        insert_query = "INSERT INTO arrival_forecasts (forecast_generated_at, last_bus_detected_at, predicted_arrival_at, average_interval_used) VALUES (%s, %s, %s, %s);"
-        cursor.execute(insert_query, (now, last_detection_time, predicted_arrival, avg_interval_seconds))
-        conn.commit()
-        cursor.close()
+        repo.insert_forecast(now, last_detection_time, predicted_arrival, avg_interval_seconds)
+        repo.commit()
         print(f"✅ Forecast saved successfully. Predicted arrival: {predicted_arrival.strftime('%I:%M:%S %p')}")
 
     except Exception as e:
+        repo.rollback()
         print(f"🚨 ERROR during forecasting: {e}")
 
 if __name__ == "__main__":
-    conn = None
+    repo = None
     try:
         print("--- Processing all historical data in the cloud ---")
-        conn = get_db_connection()
-        run_data_preparation(conn)
-        run_forecasting(conn)
+        repo = Repository.connect()
+        run_data_preparation(repo)
+        run_forecasting(repo)
         print("\n--- Cloud data processing complete ---")
     except Exception as e:
         print(f"🚨 A top-level error occurred: {e}")
     finally:
-        if conn:
-            conn.close()
+        if repo:
+            repo.close()
@@ -0,0 +1,211 @@
+import datetime
+from db import connect_sqlite, get_db_connection
+from partitions import (PartitionCache, ensure_partitions, sqlite_insert_detection, sqlite_is_partitioned,
+                        sqlite_last_detection, sqlite_range_summary, sqlite_select_range)
+
+# --- STATEMENTS ---
+# Every operation runs one of these constant statements on one long-lived
+# connection and cursor. SQLite compiles each statement once and reuses it from
+# the connection's statement cache; on Postgres the connection itself is what
+# gets reused (a Cloud SQL connect costs far more than any of these queries).
+INSERT_DETECTION = "INSERT INTO detections (timestamp, bus_count) VALUES (%s, %s);"
+LAST_DETECTION = {
+    # Reads only the current month's partition unless it is still empty.
+    "postgres": """
+        SELECT COALESCE(
+            (SELECT MAX(timestamp) FROM detections WHERE timestamp >= date_trunc('month', CURRENT_DATE)),
+            (SELECT MAX(timestamp) FROM detections)
+        );
+    """,
+    "sqlite": "SELECT MAX(timestamp) FROM detections;",
+}
+LAST_DETECTION_BEFORE = "SELECT MAX(timestamp) FROM detections WHERE timestamp < %s;"
+DETECTIONS_ALL = "SELECT timestamp FROM detections ORDER BY timestamp ASC;"
+DETECTIONS_FROM = "SELECT timestamp FROM detections WHERE timestamp >= %s ORDER BY timestamp ASC;"
+DETECTIONS_BETWEEN = "SELECT timestamp FROM detections WHERE timestamp >= %s AND timestamp < %s ORDER BY timestamp ASC;"
+DETECTION_SUMMARY = "SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM detections WHERE timestamp >= %s AND timestamp < %s;"
+
+LATEST_ANALYSIS_DATE = "SELECT MAX(analysis_date) FROM daily_analysis;"
+UPSERT_ANALYSIS = """
+    INSERT INTO daily_analysis (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count, last_updated)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT(analysis_date, day_of_week, daypart) DO UPDATE SET
+        average_interval_seconds = EXCLUDED.average_interval_seconds,
+        detection_count = EXCLUDED.detection_count,
+        last_updated = EXCLUDED.last_updated;
+"""
+INTERVAL_FOR_PERIOD = """
+    SELECT average_interval_seconds FROM daily_analysis
+    WHERE day_of_week = %s AND daypart = %s
+    ORDER BY analysis_date DESC LIMIT 1;
+"""
+OVERALL_INTERVAL = "SELECT AVG(average_interval_seconds) FROM daily_analysis;"
+
+INSERT_FORECAST = """
+    INSERT INTO arrival_forecasts (forecast_generated_at, last_bus_detected_at, predicted_arrival_at, average_interval_used)
+    VALUES (%s, %s, %s, %s);
+"""
+LATEST_FORECAST = "SELECT predicted_arrival_at FROM arrival_forecasts ORDER BY forecast_generated_at DESC LIMIT 1;"
+LAST_FORECAST_DETECTION = "SELECT MAX(last_bus_detected_at) FROM arrival_forecasts;"
+
+# Edge databases, as written by data_preparation.py and forecast.py.
+EDGE_DETECTIONS_DB = "muni_detections.db"
+EDGE_ANALYSIS_DB = "analysis_results.db"
+EDGE_FORECAST_DB = "forecast.db"
+
+
+# The layout of each SQLite file (by path), checked once per process rather
+# than on every Repository (the dashboard opens one per request):
+# "months" (migrated month tables), "table" (the cloud schema) or "edge".
+_sqlite_layouts = {}
+EDGE_SCHEMA_ERROR = ("{path} still has the original edge detections table (no bus_count column, "
+                     "'T'-separated timestamps). Run `python partitions.py migrate --sqlite {path}` "
+                     "before logging detections to it.")
+
+
+def _as_date(value):
+    # SQLite hands DATE columns back as text.
+    return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+
+
+class Repository:
+    """
+    Typed reads and writes of detections, daily_analysis and arrival_forecasts,
+    shared by the edge (SQLite) and cloud (Postgres) deployments. Writes are
+    not committed until commit() is called, so callers control transactions;
+    cursor() exposes the same connection for helpers that take a cursor.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = getattr(conn, "dialect", "postgres")
+        self._cursor = conn.cursor()
+        self._partitions = PartitionCache()
+        # A partitioned SQLite database is read and written through its month tables, not the `detections` view.
+        self._sqlite_layout = self._layout(conn) if self.dialect == "sqlite" else None
+        self._sqlite_months = self._sqlite_layout == "months"
+
+    @staticmethod
+    def _layout(conn):
+        path = getattr(conn, "path", None)
+        if path in _sqlite_layouts:
+            return _sqlite_layouts[path]
+        if sqlite_is_partitioned(conn):
+            layout = "months"
+        else:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(detections);").fetchall()]
+            layout = "edge" if columns and "bus_count" not in columns else "table"
+        if path is not None:
+            _sqlite_layouts[path] = layout
+        return layout
+
+    @classmethod
+    def connect(cls):
+        """The deployment's database, as chosen by get_db_connection()."""
+        return cls(get_db_connection())
+
+    @classmethod
+    def sqlite(cls, path=EDGE_DETECTIONS_DB, analysis_db=EDGE_ANALYSIS_DB, forecast_db=EDGE_FORECAST_DB, tuned=True):
+        """The edge databases on one connection, with the analysis and forecast files attached."""
+        attach = {name: db_path for name, db_path in (("analysis", analysis_db), ("forecast", forecast_db)) if db_path}
+        return cls(connect_sqlite(path, attach, tuned))
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self._cursor.close()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _scalar(self, query, params=()):
+        self._cursor.execute(query, params)
+        row = self._cursor.fetchone()
+        return row[0] if row else None
+
+    # --- DETECTIONS ---
+    def ensure_partitions(self):
+        """Creates upcoming monthly partitions on Postgres; SQLite month tables are created on insert."""
+        if self.dialect == "postgres":
+            return ensure_partitions(self._cursor, cache=self._partitions)
+        return []
+
+    def insert_detection(self, timestamp, bus_count=1):
+        if self._sqlite_layout == "edge":
+            raise RuntimeError(EDGE_SCHEMA_ERROR.format(path=getattr(self.conn, "path", "The database")))
+        if self._sqlite_months:
+            sqlite_insert_detection(self.conn, timestamp, bus_count, cache=self._partitions, detected_object="bus")
+        else:
+            self._cursor.execute(INSERT_DETECTION, (timestamp, bus_count))
+
+    def last_detection_time(self):
+        if self._sqlite_months:
+            return sqlite_last_detection(self.conn)
+        return self._scalar(LAST_DETECTION[self.dialect])
+
+    def last_detection_before(self, timestamp):
+        if self._sqlite_months:
+            return sqlite_last_detection(self.conn, before=timestamp)
+        return self._scalar(LAST_DETECTION_BEFORE, (timestamp,))
+
+    def detection_timestamps(self, start=None, end=None):
+        """Ascending detection timestamps in [start, end); either bound may be left open."""
+        if self._sqlite_months:
+            return [row[0] for row in sqlite_select_range(self.conn, start, end)]
+        if start is None and end is None:
+            self._cursor.execute(DETECTIONS_ALL)
+        elif end is None:
+            self._cursor.execute(DETECTIONS_FROM, (start,))
+        else:
+            self._cursor.execute(DETECTIONS_BETWEEN, (start or datetime.datetime.min, end))
+        return [row[0] for row in self._cursor.fetchall()]
+
+    def detection_summary(self, start, end):
+        """(count, first, last) of the detections in [start, end)."""
+        if self._sqlite_months:
+            return sqlite_range_summary(self.conn, start, end)
+        self._cursor.execute(DETECTION_SUMMARY, (start, end))
+        return tuple(self._cursor.fetchone())
+
+    # --- DAILY ANALYSIS ---
+    def latest_analysis_date(self):
+        return _as_date(self._scalar(LATEST_ANALYSIS_DATE))
+
+    def upsert_daily_analysis(self, rows):
+        """Upserts (analysis_date, day_of_week, daypart, average_interval_seconds, detection_count) rows."""
+        now = datetime.datetime.now()
+        params = [
+            (_as_date(day), day_of_week, daypart, None if average is None else float(average), int(count), now)
+            for day, day_of_week, daypart, average, count in rows
+        ]
+        self._cursor.executemany(UPSERT_ANALYSIS, params)
+        return len(params)
+
+    def interval_for(self, day_of_week, daypart):
+        """The newest average interval for a weekday and daypart, or None."""
+        return self._scalar(INTERVAL_FOR_PERIOD, (day_of_week, daypart))
+
+    def overall_average_interval(self):
+        return self._scalar(OVERALL_INTERVAL)
+
+    # --- FORECASTS ---
+    def insert_forecast(self, generated_at, last_detected_at, predicted_arrival_at, average_interval_seconds):
+        self._cursor.execute(INSERT_FORECAST, (generated_at, last_detected_at, predicted_arrival_at, float(average_interval_seconds)))
+
+    def latest_forecast(self):
+        """The newest forecast's predicted arrival, or None."""
+        return self._scalar(LATEST_FORECAST)
+
+    def last_forecast_detection(self):
+        return self._scalar(LAST_FORECAST_DETECTION)
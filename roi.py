@@ -0,0 +1,126 @@
+import math
+import os
+import cv2
+import numpy as np
+
+# --- CONSTANTS ---
+# Regions of interest as "x1,y1,x2,y2;x1,y1,x2,y2", in pixels or (all values <= 1) as fractions of the frame.
+DETECTION_ROIS = os.environ.get("DETECTION_ROIS", "")
+ROI_IMGSZ = int(os.environ.get("ROI_IMGSZ", "416"))
+# ROIs wider than this aspect ratio are split into overlapping tiles; 0 never tiles.
+ROI_TILE_ASPECT = float(os.environ.get("ROI_TILE_ASPECT", "0"))
+TILE_OVERLAP = 0.25
+MERGE_IOU = 0.5
+
+
+# --- REGIONS ---
+def parse_rois(spec):
+    """Parses DETECTION_ROIS-style text into a list of (x1, y1, x2, y2) tuples."""
+    rois = []
+    for part in filter(None, (part.strip() for part in spec.split(";"))):
+        values = tuple(float(value) for value in part.split(","))
+        if len(values) != 4:
+            raise ValueError(f"ROI '{part}' needs four values: x1,y1,x2,y2")
+        rois.append(values)
+    return rois
+
+
+def resolve_rois(rois, frame_shape):
+    """Pixel (x1, y1, x2, y2) crops clipped to the frame. Fractional ROIs are scaled to its size."""
+    height, width = frame_shape[:2]
+    resolved = []
+    for roi in rois:
+        if all(value <= 1.0 for value in roi):
+            roi = (roi[0] * width, roi[1] * height, roi[2] * width, roi[3] * height)
+        x1, y1 = max(0, int(roi[0])), max(0, int(roi[1]))
+        x2, y2 = min(width, int(math.ceil(roi[2]))), min(height, int(math.ceil(roi[3])))
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError(f"ROI {roi} is empty inside a {width}x{height} frame")
+        resolved.append((x1, y1, x2, y2))
+    return resolved
+
+
+def tile_roi(roi, max_aspect, overlap=TILE_OVERLAP):
+    """Splits a wide ROI into overlapping tiles no wider than `max_aspect` times its height."""
+    x1, y1, x2, y2 = roi
+    tile_width = min(x2 - x1, int(round((y2 - y1) * max_aspect)))
+    if not max_aspect or tile_width >= x2 - x1:
+        return [roi]
+    count = math.ceil((x2 - x1 - tile_width) / (tile_width * (1 - overlap))) + 1
+    step = (x2 - x1 - tile_width) / (count - 1)
+    return [(x1 + int(round(i * step)), y1, x1 + int(round(i * step)) + tile_width, y2) for i in range(count)]
+
+
+def plan_crops(rois, frame_shape, tile_aspect=ROI_TILE_ASPECT, overlap=TILE_OVERLAP):
+    """The crops inference runs on: every ROI, tiled where it is too wide."""
+    return [tile for roi in resolve_rois(rois, frame_shape) for tile in tile_roi(roi, tile_aspect, overlap)]
+
+
+def crop_shapes(crops):
+    """The image shape of every crop, for warming the detector up on the batch it will really see."""
+    return [(y2 - y1, x2 - x1, 3) for x1, y1, x2, y2 in crops]
+
+
+# --- BOXES ---
+def remap(detections, crop):
+    """Shifts [x1, y1, x2, y2, ...] rows from crop coordinates to full-frame coordinates."""
+    detections = detections.copy()
+    detections[:, [0, 2]] += crop[0]
+    detections[:, [1, 3]] += crop[1]
+    return detections
+
+
+def box_iou(a, b):
+    """Pairwise IoU of two (N, 4) and (M, 4) [x1, y1, x2, y2] arrays."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def merge_detections(detections, iou_threshold=MERGE_IOU):
+    """Drops the lower-confidence copy of an object seen by two overlapping crops (per-class NMS)."""
+    if len(detections) < 2:
+        return detections
+    detections = detections[detections[:, 4].argsort()[::-1]]
+    overlaps = (box_iou(detections, detections) > iou_threshold) & (detections[:, 5][:, None] == detections[:, 5][None, :])
+    suppressed = np.zeros(len(detections), dtype=bool)
+    keep = []
+    for i in range(len(detections)):
+        if not suppressed[i]:
+            keep.append(i)
+            suppressed |= overlaps[i]
+    return detections[keep]
+
+
+# --- DETECTION ---
+class RoiDetector:
+    """
+    Runs a started Detector on the configured crops of each frame, as one
+    batch through Detector.infer (so the latency report covers ROI mode too),
+    and returns detections in full-frame coordinates, so the tracker,
+    snapshots and display never see crop coordinates. The Detector sets the
+    reduced `imgsz`, the classes and the device.
+    """
+
+    def __init__(self, detector, crops):
+        self.detector = detector
+        self.crops = crops
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    def detect(self, frame):
+        """An (N, 6) array of [x1, y1, x2, y2, conf, cls] in full-frame coordinates."""
+        results = self.detector.infer([frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.crops])
+        detections = np.concatenate([remap(result.boxes.data.cpu().numpy(), crop) for result, crop in zip(results, self.crops)])
+        return merge_detections(detections) if len(self.crops) > 1 else detections
+
+    def draw_regions(self, frame):
+        """Outlines the crops on `frame` in place."""
+        for x1, y1, x2, y2 in self.crops:
+            cv2.rectangle(frame, (x1, y1), (x2 - 1, y2 - 1), (255, 160, 0), 1)
+        return frame
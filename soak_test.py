@@ -0,0 +1,161 @@
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import main as detection_loop
+from capture import CaptureSource
+from guardrails import rss_bytes, trackers_of, tracker_state_size
+from roi import parse_rois
+
+# --- CONSTANTS ---
+MB = 1024 * 1024
+
+
+class FootageReplay:
+    """
+    A looping clip that stands in for the camera in main.run_sampled_loop.
+    now() is footage time, so the loop samples and logs as it would live,
+    only as fast as the detector allows; read() ends the run after `hours`
+    of footage and takes a memory sample every `sample_minutes`.
+    """
+
+    def __init__(self, clip, hours, sample_minutes):
+        self.cap = CaptureSource(clip, loop_file=True)
+        self.hours = hours
+        self.sample_seconds = sample_minutes * 60
+        self.started = datetime.datetime.now()
+        self.fps = None
+        self.frames = 0
+        self.next_sample = 0.0
+        self.stage = None
+        self.samples = []
+
+    @property
+    def simulated_seconds(self):
+        return self.frames / self.fps
+
+    def now(self):
+        return self.started + datetime.timedelta(seconds=self.simulated_seconds)
+
+    def read(self):
+        success, frame = self.cap.read()
+        self.fps = self.fps or self.cap.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        if not success or (self.stage and self.simulated_seconds >= self.hours * 3600):
+            return False, None
+        self.frames += 1
+        if self.stage and self.simulated_seconds >= self.next_sample:
+            self.sample()
+            self.next_sample += self.sample_seconds
+        return success, frame
+
+    def sample(self):
+        heap_bytes, _ = tracemalloc.get_traced_memory()
+        latest = {
+            "hours": self.simulated_seconds / 3600,
+            "rss_mb": rss_bytes() / MB,
+            "heap_mb": heap_bytes / MB,
+            "tracks": sum(tracker_state_size(tracker) for tracker in trackers_of(self.stage.guarded)),
+        }
+        self.samples.append(latest)
+        print(f"[{latest['hours']:6.2f} h footage] RSS {latest['rss_mb']:8.1f} MB  "
+              f"heap {latest['heap_mb']:7.1f} MB  tracker {latest['tracks']:5d} tracks")
+
+    def health(self):
+        return self.cap.health()
+
+    def release(self):
+        self.cap.release()
+
+
+def run_soak(args):
+    """
+    Replays a looping clip through main.py's own loop (run_sampled_loop and
+    FrameStage: inference, tracker, bus check, annotation, logging and
+    snapshots) with only the display stubbed, and samples memory as footage
+    time advances. Logging goes to a SQLite stand-in with --sqlite, else to
+    a stub. Returns the list of samples.
+    """
+    replay = FootageReplay(args.clip, args.hours, args.sample_minutes)
+    success, frame = replay.read()
+    if not success:
+        raise SystemExit(f"Error: Could not read '{args.clip}'.")
+
+    if args.rois:
+        infer, stage = detection_loop.start_roi_detection(frame.shape, parse_rois(args.rois), device=args.device)
+    else:
+        infer, stage = detection_loop.start_detection(frame.shape, device=args.device)
+    logged = []
+    if args.sqlite:
+        # The real log_bus_detection path, through the shared repository.
+        os.environ["SQLITE_DB_PATH"] = args.sqlite
+    else:
+        stage.log = lambda current_time, inferred_at: logged.append(current_time) or True
+    if not args.guardrails:
+        stage.tracker_guard.interval_seconds = float("inf")
+
+    tracemalloc.start()
+    replay.stage = stage
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as snapshots:
+        detection_loop.OUTPUT_DIR = snapshots
+        try:
+            detection_loop.run_sampled_loop(replay, infer, stage, show=lambda frame: False, clock=replay.now)
+        finally:
+            replay.release()
+            detection_loop.drop_repository()
+
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {replay.simulated_seconds / 3600:.2f} h of footage in {elapsed / 60:.1f} min "
+          f"({replay.simulated_seconds / max(elapsed, 1e-9):.0f}x real time).")
+    if not args.sqlite:
+        print(f"{len(logged)} detections would have been logged.")
+    return replay.samples
+
+
+def evaluate(samples, args):
+    """Compares the end of the run with a post-warmup baseline. Returns a list of failures."""
+    if len(samples) < 3:
+        return ["Too few samples; run longer or sample more often."]
+    baseline = samples[max(1, int(len(samples) * args.warmup_fraction))]
+    tail = samples[-3:]
+    end = {key: sum(s[key] for s in tail) / len(tail) for key in ("rss_mb", "heap_mb", "tracks")}
+
+    failures = []
+    if end["rss_mb"] - baseline["rss_mb"] > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {end['rss_mb'] - baseline['rss_mb']:.1f} MB (limit {args.max_rss_growth_mb} MB)")
+    if end["heap_mb"] - baseline["heap_mb"] > args.max_heap_growth_mb:
+        failures.append(f"Python heap grew {end['heap_mb'] - baseline['heap_mb']:.1f} MB (limit {args.max_heap_growth_mb} MB)")
+    if max(s["tracks"] for s in samples) > args.max_tracks:
+        failures.append(f"Tracker state reached {max(s['tracks'] for s in samples)} tracks (limit {args.max_tracks})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak-test the detection loop on replayed footage and fail on memory growth.")
+    parser.add_argument("clip", help="Video file to loop.")
+    parser.add_argument("--hours", type=float, default=6.0, help="Hours of footage to replay.")
+    parser.add_argument("--sample-minutes", type=float, default=10.0, help="Footage minutes between samples.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--rois", help='Soak the ROI path instead, e.g. "0,0.35,1,0.8" (see DETECTION_ROIS).')
+    parser.add_argument("--sqlite", metavar="DB_PATH", help="Log detections to this SQLite stand-in (see bench_load.py) instead of a stub.")
+    parser.add_argument("--no-guardrails", dest="guardrails", action="store_false", help="Disable tracker pruning (to reproduce growth).")
+    parser.add_argument("--warmup-fraction", type=float, default=0.1, help="Share of the run ignored before the baseline sample.")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    parser.add_argument("--max-heap-growth-mb", type=float, default=20.0)
+    parser.add_argument("--max-tracks", type=int, default=1000)
+    args = parser.parse_args()
+
+    failures = evaluate(run_soak(args), args)
+    if failures:
+        for failure in failures:
+            print(f"🚨 SOAK FAILURE: {failure}")
+        sys.exit(1)
+    print("✅ Soak test passed: memory and tracker state stayed bounded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import atexit
+import datetime
+import threading
+import time
+import uuid
+
+# --- CONSTANTS ---
+# Hops in the order a detection passes through them, from camera to dashboard.
+HOPS = ["captured_at", "inferred_at", "inserted_at", "prepared_at", "forecasted_at", "first_served_at"]
+STAGES = [
+    ("inference", "captured_at", "inferred_at"),
+    ("insert", "inferred_at", "inserted_at"),
+    ("data preparation", "inserted_at", "prepared_at"),
+    ("forecasting", "prepared_at", "forecasted_at"),
+    ("web visibility", "forecasted_at", "first_served_at"),
+    ("end to end", "captured_at", "first_served_at"),
+]
+# How often the dashboard writes the first-served stamps it has collected.
+SERVED_FLUSH_SECONDS = 10
+
+
+def create_traces_table(cursor):
+    """Creates the table holding one row of hop timestamps per detection event."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detection_traces (
+            trace_id TEXT PRIMARY KEY,
+            detection_timestamp TIMESTAMP NOT NULL,
+            captured_at TIMESTAMP NOT NULL,
+            inferred_at TIMESTAMP,
+            inserted_at TIMESTAMP,
+            prepared_at TIMESTAMP,
+            forecasted_at TIMESTAMP,
+            first_served_at TIMESTAMP
+        );
+    """)
+    # Keeps the dashboard's "mark as served" update to the few unserved rows.
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS detection_traces_unserved_idx
+        ON detection_traces (detection_timestamp) WHERE first_served_at IS NULL;
+    """)
+
+
+class DetectionTrace:
+    """Hop timestamps for one detection event, identified by a trace ID."""
+
+    def __init__(self, captured_at, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.detection_timestamp = captured_at
+        self.hops = {"captured_at": captured_at}
+
+    def mark(self, hop, at=None):
+        self.hops[hop] = at or datetime.datetime.now()
+
+    def insert(self, cursor):
+        """Writes the hops recorded so far. Run it after the detection has been committed, in its own transaction."""
+        self.mark("inserted_at")
+        cursor.execute("""
+            INSERT INTO detection_traces (trace_id, detection_timestamp, captured_at, inferred_at, inserted_at)
+            VALUES (%s, %s, %s, %s, %s);
+        """, (self.trace_id, self.detection_timestamp, self.hops["captured_at"],
+              self.hops.get("inferred_at"), self.hops["inserted_at"]))
+
+    def record(self, cursor, hop):
+        """Marks a later hop now and stores it on the existing trace row."""
+        if hop not in HOPS:
+            raise ValueError(f"Unknown hop '{hop}'")
+        self.mark(hop)
+        cursor.execute(f"UPDATE detection_traces SET {hop} = %s WHERE trace_id = %s;", (self.hops[hop], self.trace_id))
+
+
+def mark_served(cursor, newest_detection, since, served_at=None):
+    """Stamps first_served_at (default: now) on every not-yet-served trace the dashboard is showing."""
+    cursor.execute("""
+        UPDATE detection_traces SET first_served_at = %s
+        WHERE first_served_at IS NULL AND detection_timestamp >= %s AND detection_timestamp <= %s;
+    """, (served_at or datetime.datetime.now(), since, newest_detection))
+
+
+class ServedRecorder:
+    """
+    Collects what the dashboard has shown and stamps first_served_at from a
+    background thread every SERVED_FLUSH_SECONDS, so page loads never write.
+    Only a page showing a newer detection than the last one is remembered.
+    Whatever is still pending is flushed when the process exits, since a
+    scaled-to-zero instance may stop before the thread gets to run again.
+    """
+
+    def __init__(self, connect, interval=SERVED_FLUSH_SECONDS):
+        self.connect = connect
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = []  # (served_at, newest_detection, since), newest_detection ascending
+        self._newest = None
+        self._thread = None
+        atexit.register(self.flush)
+
+    def note(self, newest_detection, since):
+        """Records that a page showing detections in [since, newest_detection] was served now."""
+        with self._lock:
+            if self._newest is not None and newest_detection <= self._newest:
+                return
+            self._newest = newest_detection
+            self._pending.append((datetime.datetime.now(), newest_detection, since))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="served-recorder", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """Writes the collected stamps in one transaction; they are kept for the next flush if it fails."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        conn = None
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            # Oldest first, so each trace keeps the earliest page that showed it.
+            for served_at, newest_detection, since in pending:
+                mark_served(cursor, newest_detection, since, served_at)
+            conn.commit()
+        except Exception as e:
+            with self._lock:
+                self._pending = pending + self._pending
+            print(f"⚠️ Could not record trace visibility: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+# --- REPORTING ---
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def freshness_report(conn, days=7):
+    """Prints the lag distribution of each stage over the last `days` days and names the dominant one."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(HOPS)} FROM detection_traces WHERE captured_at >= %s;",
+                   (datetime.datetime.now() - datetime.timedelta(days=days),))
+    rows = [dict(zip(HOPS, row)) for row in cursor.fetchall()]
+    cursor.close()
+
+    print(f"\n--- Freshness lag over the last {days} days ({len(rows)} traced detections) ---")
+    print(f"{'stage':<18} {'n':>6} {'p50 s':>9} {'p90 s':>9} {'p99 s':>9} {'max s':>9}")
+    medians = {}
+    for stage, start, end in STAGES:
+        lags = sorted((row[end] - row[start]).total_seconds() for row in rows if row[start] and row[end])
+        if not lags:
+            print(f"{stage:<18} {0:>6} {'-':>9} {'-':>9} {'-':>9} {'-':>9}")
+            continue
+        medians[stage] = percentile(lags, 0.5)
+        print(f"{stage:<18} {len(lags):>6} {percentile(lags, 0.5):>9.2f} {percentile(lags, 0.9):>9.2f} "
+              f"{percentile(lags, 0.99):>9.2f} {lags[-1]:>9.2f}")
+
+    pipeline = {stage: median for stage, median in medians.items() if stage != "end to end"}
+    if pipeline:
+        dominant = max(pipeline, key=pipeline.get)
+        print(f"Dominant stage (by median): {dominant}")
+    print("Note: web visibility depends on when the page is next loaded, and hops are stamped on two hosts' clocks.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report capture-to-dashboard freshness from detection traces.")
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    from db import get_db_connection
+    conn = get_db_connection()
+    try:
+        freshness_report(conn, args.days)
+    finally:
+        conn.close()